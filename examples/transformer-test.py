@@ -4,42 +4,225 @@
 # See accompanying file LICENSE or copy at http://opensource.org/licenses/MIT
 #+============================================================================
 
+import contextlib
+import functools
 import numpy as np
-import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
-#from torch.nn.functional import scaled_dot_product_attention
+import torch.nn.functional as F
 import transformer
 import collections
 
+# printing tensors from the test bodies forces a device sync and a full
+# host-side formatting pass per call; only do it when explicitly requested
+DEBUG = os.environ.get("SEEGNIFY_DEBUG", "0") == "1"
+
+def debug(*args, **kwargs):
+  if DEBUG:
+    print(*args, **kwargs)
+
+# opt-in torch.compile wrapper: the toy shapes below are dominated by per-op
+# dispatch overhead, which reduce-overhead mode removes, but compilation
+# itself takes seconds so the eager path stays the default
+COMPILE = os.environ.get("SEEGNIFY_COMPILE", "0") == "1"
+
+def compiled(model):
+  if COMPILE:
+    return torch.compile(model, mode="reduce-overhead", fullgraph=True)
+  return model
+
+# optional reduced-precision run (e.g. SEEGNIFY_DTYPE=bfloat16): halves the
+# bandwidth through the attention matmuls and softmax and lets the fused
+# kernels dispatch to reduced-precision paths; float32 stays the default so
+# printed values keep full parity with the C++ implementation
+DTYPE = getattr(torch, os.environ.get("SEEGNIFY_DTYPE", "float32"))
+
+def autocast():
+  if DTYPE is torch.float32:
+    return contextlib.nullcontext()
+  return torch.autocast(device_type="cpu", dtype=DTYPE)
+
+# ---------------------------------------------------------------------------
+# Fixed test weights, hoisted to module scope so each literal is parsed into
+# a tensor once at import instead of on every test invocation. The attention,
+# feed-forward and cross-attention blocks are shared verbatim by the encoder,
+# decoder and transformer tests.
+# ---------------------------------------------------------------------------
+
+# parse a weight literal in one C-level pass and wrap it without a copy,
+# instead of letting torch.tensor recurse over the nested Python lists
+def _t(values):
+  return torch.from_numpy(np.array(values, dtype=np.float32))
+
+# torch.nn.MultiheadAttention / transformer.MultiHeadAttention test weights
+_MHA_W_Q = _t(
+    [[ 0.4271,  0.3013, -0.4279, -0.2122],
+    [ 0.2983,  0.3350, -0.4619,  0.5432],
+    [-0.1488,  0.1778, -0.4288, -0.5003],
+    [ 0.1173,  0.3713, -0.2347, -0.2251]])
+_MHA_W_K = _t(
+    [[ 0.1557,  0.4673,  0.0920,  0.3889],
+    [ 0.5867,  0.0088,  0.4371,  0.0371],
+    [ 0.4897, -0.0109, -0.0646,  0.5190],
+    [-0.5768,  0.1376, -0.5507,  0.5315]])
+_MHA_W_V = _t(
+    [[-0.3599, -0.4841,  0.0526, -0.5235],
+    [-0.1576,  0.4844, -0.3817,  0.2549],
+    [-0.1432,  0.5141, -0.5741, -0.0179],
+    [-0.0103, -0.4235, -0.5195, -0.1589]])
+_MHA_W_O = _t(
+    [[-0.2588,  0.4873,  0.0642,  0.4206],
+    [ 0.3272,  0.3202,  0.4458, -0.3825],
+    [-0.4631, -0.2740, -0.2628, -0.4749],
+    [-0.3654,  0.4841,  0.4618, -0.1188]])
+_MHA_B_Q = _t([0.4755, 0.1042, 0.6459, 0.2230])
+_MHA_B_K = _t([0.0739, 0.6705, 0.8532, 0.7830])
+_MHA_B_V = _t([0.1097, 0.8451, 0.7208, 0.2440])
+_MHA_B_O = _t([0.0307, 0.1667, 0.4442, 0.1971])
+
+# self-attention block shared by encoder, decoder and transformer tests
+_ATTN_W_Q = _t(
+    [[-1.2321, -0.4785, -0.4598, -0.1860],
+    [ 0.4576,  0.4961, -0.0903, -0.4833],
+    [-0.1442,  0.3495,  0.4236, -0.0846],
+    [-0.3082,  0.0956, -0.2470,  0.3061]])
+_ATTN_B_Q = _t([-1.3717, -0.1179, -0.0096, -0.4240])
+_ATTN_W_K = _t(
+    [[-2.2321, -0.4785, -0.4598, -0.1860],
+    [ 0.4576,  0.4961, -0.0903, -0.4833],
+    [-0.1442,  0.3495,  0.4236, -0.0846],
+    [-0.3082,  0.0956, -0.2470,  0.3061]])
+_ATTN_B_K = _t([-2.3717, -0.1179, -0.0096, -0.4240])
+_ATTN_W_V = _t(
+    [[-3.2321, -0.4785, -0.4598, -0.1860],
+    [ 0.4576,  0.4961, -0.0903, -0.4833],
+    [-0.1442,  0.3495,  0.4236, -0.0846],
+    [-0.3082,  0.0956, -0.2470,  0.3061]])
+_ATTN_B_V = _t([-3.3717, -0.1179, -0.0096, -0.4240])
+_ATTN_W_O = _t(
+    [[-4.2321, -0.4785, -0.4598, -0.1860],
+    [ 0.4576,  0.4961, -0.0903, -0.4833],
+    [-0.1442,  0.3495,  0.4236, -0.0846],
+    [-0.3082,  0.0956, -0.2470,  0.3061]])
+_ATTN_B_O = _t([-4.3717, -0.1179, -0.0096, -0.4240])
+
+# cross-attention block shared by decoder and transformer tests
+_CROSS_W_Q = _t(
+    [[ 0.0675,  0.0034,  0.2860, -0.0438],
+    [ 0.3234,  0.4208, -0.0814, -0.0883],
+    [-0.3376,  0.2880,  0.0641, -0.4295],
+    [ 0.4480,  0.4328, -0.4657,  0.1207]])
+_CROSS_B_Q = _t([-0.3390,  0.0716,  0.4804, -0.4253])
+_CROSS_W_K = _t(
+    [[ 0.2975,  0.0247,  0.4618, -0.1429],
+    [-0.0016, -0.0542, -0.3919,  0.1051],
+    [ 0.4285,  0.0760, -0.3002, -0.2579],
+    [-0.1038,  0.4511,  0.4412,  0.2605]])
+_CROSS_B_K = _t([-0.3793,  0.4552,  0.1502,  0.3554])
+_CROSS_W_V = _t(
+    [[-0.4192, -0.4004,  0.0120, -0.4717],
+    [-0.3308, -0.4728, -0.1381,  0.3374],
+    [ 0.1521, -0.1548,  0.2885,  0.4352],
+    [-0.1196, -0.2579, -0.3167,  0.0128]])
+_CROSS_B_V = _t([0.4992, -0.2558,  0.1871, -0.3701])
+_CROSS_W_O = _t(
+    [[ 1.5146e-01,  5.0816e-02,  3.9053e-04, -4.6405e-01],
+    [-1.2832e-01, -4.3910e-01, -1.8390e-01, -5.1324e-02],
+    [ 4.4734e-01, -3.3816e-01,  1.3738e-01, -1.3041e-01],
+    [ 1.8204e-01, -2.9708e-01,  3.2434e-01, -6.3109e-02]])
+_CROSS_B_O = _t([-0.4427, -0.0959, -0.2821, -0.2209])
+
+# feed-forward block shared by encoder, decoder and transformer tests
+_FFN_W_1 = _t(
+    [[-5.4208,  0.2836, -0.1770,  0.3684],
+    [ 0.3448,  0.4124, -0.2545,  0.2874],
+    [-0.4372,  0.4165, -0.2362,  0.1144]])
+_FFN_B_1 = _t([ 5.2621, -0.3262,  0.4815])
+_FFN_W_2 = _t(
+    [[-6.3926, -0.1717,  0.2300],
+    [ 0.0701,  0.3166, -0.2458],
+    [ 0.1431, -0.3391,  0.5407],
+    [ 0.4126, -0.3719,  0.5352]])
+_FFN_B_2 = _t([-6.5333, -0.0515, -0.1337,  0.0297])
+
+# transformer test embeddings and output projection
+_ENC_EMBED = _t(
+    [[-1.5104, -0.0284,  0.8700,  0.8670],
+    [ 1.1990,  1.1361,  0.8644,  0.1473],
+    [-0.7335,  0.3807,  0.7741,  0.4396],
+    [-0.7043,  1.6892, -0.5124,  0.4657],
+    [ 0.0162, -1.9550,  1.6194,  1.5560],
+    [ 1.3285,  0.2094, -1.5481,  0.2234],
+    [-0.8587, -0.4757,  0.1260, -1.9552],
+    [-0.7352, -0.9533, -0.7015, -1.8978],
+    [-0.3166,  1.9976,  0.1297,  0.9044],
+    [ 0.7586, -1.0734, -0.4338, -0.8578]])
+_DEC_EMBED = _t(
+    [[-0.5281,  0.1697, -0.9366,  0.0129],
+    [ 0.1969, -1.1860,  0.0961, -0.6315],
+    [-0.1603, -0.1080,  0.1573,  0.9020],
+    [ 1.2745,  0.0302,  1.0822, -0.4542],
+    [-0.5246, -0.9769, -0.6335,  2.4609],
+    [-0.7565,  1.0006, -1.5738,  1.5421],
+    [-0.7897, -3.4246,  0.4188, -1.1293],
+    [ 0.9453, -0.1520, -0.7238,  0.7383],
+    [ 0.0729,  0.3859,  0.0163, -0.9825],
+    [-0.9148,  1.0367, -1.0432,  1.4304]])
+_FC_W = _t(
+    [[ 0.4024,  0.2209, -0.3322, -0.2039],
+    [-0.0586, -0.3453, -0.4044,  0.3376],
+    [-0.4428,  0.0175, -0.4929, -0.2737],
+    [-0.4433, -0.2716, -0.0390,  0.4631],
+    [-0.0599,  0.1389,  0.0554, -0.2265],
+    [-0.4810, -0.2936,  0.2530, -0.0608],
+    [ 0.1361,  0.1135, -0.1584, -0.0923],
+    [ 0.3696, -0.2719, -0.0755,  0.3822],
+    [-0.2697,  0.1172, -0.0242,  0.4085],
+    [-0.2495, -0.1300,  0.2470,  0.3172]])
+_FC_B = _t(
+    [ 0.1317, -0.1626, -0.0434, -0.4033,  0.0458, -0.1930,  0.3019, -0.3306,
+    -0.1221,  0.3670])
+
+# per-test weight dicts, assembled once at import so each test does a single
+# load_state_dict call over prebuilt tensors instead of rebuilding the dict
+# (and the fused W_qkv concatenations) on every run
+_ENC_LAYER_WEIGHTS = {
+  "self_attn.W_qkv.weight": torch.cat([_ATTN_W_Q, _ATTN_W_K, _ATTN_W_V], dim=0),
+  "self_attn.W_qkv.bias": torch.cat([_ATTN_B_Q, _ATTN_B_K, _ATTN_B_V]),
+  "self_attn.W_o.weight": _ATTN_W_O,
+  "self_attn.W_o.bias": _ATTN_B_O,
+  "feed_forward.w_1.weight": _FFN_W_1,
+  "feed_forward.w_1.bias": _FFN_B_1,
+  "feed_forward.w_2.weight": _FFN_W_2,
+  "feed_forward.w_2.bias": _FFN_B_2,
+}
+
+_DEC_LAYER_WEIGHTS = {
+  **_ENC_LAYER_WEIGHTS,
+  "cross_attn.W_qkv.weight": torch.cat([_CROSS_W_Q, _CROSS_W_K, _CROSS_W_V], dim=0),
+  "cross_attn.W_qkv.bias": torch.cat([_CROSS_B_Q, _CROSS_B_K, _CROSS_B_V]),
+  "cross_attn.W_o.weight": _CROSS_W_O,
+  "cross_attn.W_o.bias": _CROSS_B_O,
+}
+
+_TRANSFORMER_WEIGHTS = {
+  "encoder_embedding.weight": _ENC_EMBED,
+  "decoder_embedding.weight": _DEC_EMBED,
+  **{"encoder_layers.0." + k: v for k, v in _ENC_LAYER_WEIGHTS.items()},
+  **{"decoder_layers.0." + k: v for k, v in _DEC_LAYER_WEIGHTS.items()},
+  "fc.weight": _FC_W,
+  "fc.bias": _FC_B,
+}
+
 def scaled_dot_product_attention(query, key, value, attn_mask=None, dropout_p=0.0, is_causal=False, scale=None) -> torch.Tensor:
-    # Efficient implementation equivalent to the following:
-    L, S = query.size(-2), key.size(-2)
-    print("L=", L, "S=", S, "D=", query.size(-1))
-    scale_factor = 1 / math.sqrt(query.size(-1)) if scale is None else scale
-    attn_bias = torch.zeros(L, S, dtype=query.dtype)
-    if is_causal:
-        assert attn_mask is None
-        temp_mask = torch.ones(L, S, dtype=torch.bool).tril(diagonal=0)
-        attn_bias.masked_fill_(temp_mask.logical_not(), float("-inf"))
-        attn_bias.to(query.dtype)
-
-    if attn_mask is not None:
-        if attn_mask.dtype == torch.bool:
-            print("\nattn_mask logical_not:\n", attn_mask.logical_not())
-            attn_bias.masked_fill_(attn_mask.logical_not(), float("-inf"))
-            print("\nattn_mask filled with -Inf:\n", attn_mask)
-        else:
-            print("\nattn_mask unchanged:\n", attn_mask)
-            attn_bias += attn_mask
-    print("\nattn_bias:\n", attn_bias)
-    attn_weight = query @ key.transpose(-2, -1) * scale_factor
-    attn_weight += attn_bias
-    print("\nattention (A before softmax):\n", attn_weight)
-    attn_weight = torch.softmax(attn_weight, dim=-1)
-    print("\nattention (A after softmax):\n", attn_weight)
-    attn_weight = torch.dropout(attn_weight, dropout_p, train=True)
-    return attn_weight @ value
+    # delegate to the fused kernel, which computes QK^T, scale, mask-add,
+    # softmax and PV in one pass instead of materializing each intermediate
+    # (bool attn_mask means True=attend, same convention as the C++ side)
+    return F.scaled_dot_product_attention(query, key, value,
+      attn_mask=attn_mask, dropout_p=dropout_p, is_causal=is_causal,
+      scale=scale)
 
 
 def test_scaled_dot_product_attention():
@@ -51,19 +234,19 @@ def test_scaled_dot_product_attention():
     Q = torch.tensor([
         [1.0,2,3],
         [4,5,6],
-    ], requires_grad=True)
+    ], dtype=DTYPE, requires_grad=True)
     K = torch.tensor([
         [0.1,0.2,0.3],
         [0.4,0.5,0.6],
         [1.4,1.5,1.6],
         [2.4,2.5,2.6],
-    ], requires_grad=True)
+    ], dtype=DTYPE, requires_grad=True)
     V = torch.tensor([
         [-2.0,7,8,2,2],
         [4,1,-9,3,3],
         [1,2,3,4,4],
         [4,5,6,5,5],
-    ], requires_grad=True)
+    ], dtype=DTYPE, requires_grad=True)
     M = torch.tensor([
         [1,1,1,1],
         [1,1,0,0],
@@ -72,24 +255,25 @@ def test_scaled_dot_product_attention():
     dropout = 0.0
 
     # Display the input and output matrices
-    print("\nQuery Matrix (Q):\n", Q, Q.dtype)
-    print("\nKey Matrix (K):\n", K, K.dtype)
-    print("\nValue Matrix (V):\n", V, V.dtype)
+    debug("\nQuery Matrix (Q):\n", Q, Q.dtype)
+    debug("\nKey Matrix (K):\n", K, K.dtype)
+    debug("\nValue Matrix (V):\n", V, V.dtype)
     #print("\nMask Matrix (V):\n", M, M.dtype)
 
     # Apply multihead attention
-    attn = scaled_dot_product_attention(Q, K, V, M, dropout)
+    with autocast():
+      attn = scaled_dot_product_attention(Q, K, V, M, dropout)
 
-    print("Output:\n", attn)
+    debug("Output:\n", attn)
 
     attn_grad = torch.ones_like(attn);
     attn_grad[0,0] = 5
-    print("attn_grad", attn_grad)
+    debug("attn_grad", attn_grad)
     attn.backward(attn_grad)
 
-    print("Q gradient:\n", Q.grad)
-    print("K gradient:\n", K.grad)
-    print("V gradient:\n", V.grad)
+    debug("Q gradient:\n", Q.grad)
+    debug("K gradient:\n", K.grad)
+    debug("V gradient:\n", V.grad)
 
 
 def test_multihead_attention():
@@ -114,38 +298,38 @@ def test_multihead_attention():
         q = inputs["query"]
         k = inputs["key"]
         v = inputs["value"]
-        print("Inputs loaded from", input_path)
+        debug("Inputs loaded from", input_path)
     except:
         inputs = {}
         inputs["query"] = q
         inputs["key"] = k
         inputs["value"] = v
         torch.save(inputs, input_path)
-        print("New inputs saved to", input_path)
+        debug("New inputs saved to", input_path)
     """
 
     q = torch.tensor(
         [[[110.0878, 0.0416, 0.6166, 0.1477],
          [0.9752, 0.8866, 0.5407, 0.1911],
          [0.5300, 0.2800, 0.5306, 0.4950]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
     k = torch.tensor(
         [[[0.2248, 0.4832, 0.5916, 0.0345],
          [0.4916, 0.0881, 0.3768, 0.3048],
          [0.0780, 0.3594, 0.0297, 0.6474]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
     v = torch.tensor(
         [[[0.2014, 0.0033, 0.2326, 0.5677],
          [0.6842, 0.1161, 0.8033, 0.6450],
          [0.4097, 0.3034, 0.8000, 0.7103]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
     
-    print("q", q) 
-    print("k", k) 
-    print("v", v) 
+    debug("q", q) 
+    debug("k", k) 
+    debug("v", v) 
 
     # Create MultiheadAttention module
     attention = torch.nn.MultiheadAttention(embed_size, num_heads, 
@@ -156,85 +340,61 @@ def test_multihead_attention():
     model_path = "attention_model.pt"
     try:
         attention.load_state_dict(torch.load(model_path))
-        print("Model loaded from", model_path)
+        debug("Model loaded from", model_path)
     except:
         torch.save(attention.state_dict(), model_path)
-        print("New model saved to", model_path)
+        debug("New model saved to", model_path)
     """
 
-    weight = attention.state_dict()["in_proj_weight"]
-    weight[:,:] = torch.tensor([
-        [ 0.4271,  0.3013, -0.4279, -0.2122],
-        [ 0.2983,  0.3350, -0.4619,  0.5432],
-        [-0.1488,  0.1778, -0.4288, -0.5003],
-        [ 0.1173,  0.3713, -0.2347, -0.2251],
-
-        [ 0.1557,  0.4673,  0.0920,  0.3889],
-        [ 0.5867,  0.0088,  0.4371,  0.0371],
-        [ 0.4897, -0.0109, -0.0646,  0.5190],
-        [-0.5768,  0.1376, -0.5507,  0.5315],
-
-        [-0.3599, -0.4841,  0.0526, -0.5235],
-        [-0.1576,  0.4844, -0.3817,  0.2549],
-        [-0.1432,  0.5141, -0.5741, -0.0179],
-        [-0.0103, -0.4235, -0.5195, -0.1589]
-    ])
-
-    bias = attention.state_dict()["in_proj_bias"]
-    bias[0:bias.shape[0]] = torch.tensor([
-        0.4755, 0.1042, 0.6459, 0.2230,      
-        0.0739, 0.6705, 0.8532, 0.7830,
-        0.1097, 0.8451, 0.7208, 0.2440
-    ])
-
-    weight = attention.state_dict()["out_proj.weight"]
-    weight[:,:] = torch.tensor([
-        [-0.2588,  0.4873,  0.0642,  0.4206],
-        [ 0.3272,  0.3202,  0.4458, -0.3825],
-        [-0.4631, -0.2740, -0.2628, -0.4749],
-        [-0.3654,  0.4841,  0.4618, -0.1188]
-    ])
-
-    bias = attention.state_dict()["out_proj.bias"]
-    bias[0:bias.shape[0]] = torch.tensor([
-        0.0307, 0.1667, 0.4442, 0.1971
-    ])
-
-    print("Start Attention Params")
+    # keep autograd out of the weight setup below
+    with torch.no_grad():
+      weight = attention.state_dict()["in_proj_weight"]
+      weight[:,:] = torch.cat([_MHA_W_Q, _MHA_W_K, _MHA_W_V], dim=0)
+
+      bias = attention.state_dict()["in_proj_bias"]
+      bias[0:bias.shape[0]] = torch.cat([_MHA_B_Q, _MHA_B_K, _MHA_B_V])
+
+      weight = attention.state_dict()["out_proj.weight"]
+      weight[:,:] = _MHA_W_O
+
+      bias = attention.state_dict()["out_proj.bias"]
+      bias[0:bias.shape[0]] = _MHA_B_O
+
+    debug("Start Attention Params")
     for name in attention.state_dict():
-        print("name:", name)
+        debug("name:", name)
         param = attention.state_dict()[name]
-        print("shape:", param.shape)
-        print(param)
-    print("End Attention Params")
+        debug("shape:", param.shape)
+        debug(param)
+    debug("End Attention Params")
 
     # Apply Multihead Attention
-    A, attention_weights = attention(q, k, v,
-      need_weights=False, average_attn_weights=False)
+    with autocast():
+      A, attention_weights = compiled(attention)(q, k, v,
+        need_weights=False, average_attn_weights=False)
 
     # Print shapes of input and output tensors
-    print("Output:", A.shape)
-    print(A)
-    print("Attention weights:")    
-    print(attention_weights)
+    debug("Output:", A.shape)
+    debug(A)
+    debug("Attention weights:")    
+    debug(attention_weights)
 
     dA = torch.ones_like(A)
     dA[0,0,0] = 5
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdq", q.grad)
-    print("dAdk", k.grad)
-    print("dAdv", v.grad)
+    debug("dAdq", q.grad)
+    debug("dAdk", k.grad)
+    debug("dAdv", v.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in attention.named_parameters():
-        gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in attention.named_parameters()}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 
 def test_my_multihead_attention():
@@ -249,94 +409,63 @@ def test_my_multihead_attention():
         [[[0.0878, 0.0416, 0.6166, 0.1477],
          [0.9752, 0.8866, 0.5407, 0.1911],
          [0.5300, 0.2800, 0.5306, 0.4950]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
     k = torch.tensor(
         [[[0.2248, 0.4832, 0.5916, 0.0345],
          [0.4916, 0.0881, 0.3768, 0.3048],
          [0.0780, 0.3594, 0.0297, 0.6474]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
     v = torch.tensor(
         [[[0.2014, 0.0033, 0.2326, 0.5677],
          [0.6842, 0.1161, 0.8033, 0.6450],
          [0.4097, 0.3034, 0.8000, 0.7103]]],
-         requires_grad=True
+         dtype=DTYPE, requires_grad=True
     )
-    print("q", q) 
-    print("k", k) 
-    print("v", v) 
+    debug("q", q) 
+    debug("k", k) 
+    debug("v", v) 
 
     params = attention.state_dict()
-    params["W_q.weight"][:,:] = torch.tensor(
-        [[ 0.4271,  0.3013, -0.4279, -0.2122],
-        [ 0.2983,  0.3350, -0.4619,  0.5432],
-        [-0.1488,  0.1778, -0.4288, -0.5003],
-        [ 0.1173,  0.3713, -0.2347, -0.2251]]    
-    )
-    params["W_k.weight"][:,:] = torch.tensor(
-        [[ 0.1557,  0.4673,  0.0920,  0.3889],
-        [ 0.5867,  0.0088,  0.4371,  0.0371],
-        [ 0.4897, -0.0109, -0.0646,  0.5190],
-        [-0.5768,  0.1376, -0.5507,  0.5315]],
-    )
-    params["W_v.weight"][:,:] = torch.tensor(
-        [[-0.3599, -0.4841,  0.0526, -0.5235],
-        [-0.1576,  0.4844, -0.3817,  0.2549],
-        [-0.1432,  0.5141, -0.5741, -0.0179],
-        [-0.0103, -0.4235, -0.5195, -0.1589]]
-    )
-    params["W_o.weight"][:,:] = torch.tensor(
-        [[-0.2588,  0.4873,  0.0642,  0.4206],
-        [ 0.3272,  0.3202,  0.4458, -0.3825],
-        [-0.4631, -0.2740, -0.2628, -0.4749],
-        [-0.3654,  0.4841,  0.4618, -0.1188]]
-    )
-
-    params["W_q.bias"][:] = torch.tensor(
-        [0.4755, 0.1042, 0.6459, 0.2230]
-    )
-    params["W_k.bias"][:] = torch.tensor(
-        [0.0739, 0.6705, 0.8532, 0.7830]
-    )
-    params["W_v.bias"][:] = torch.tensor(
-        [0.1097, 0.8451, 0.7208, 0.2440]
-    )
-    params["W_o.bias"][:] = torch.tensor(
-        [0.0307, 0.1667, 0.4442, 0.1971]
-    )
+    # keep autograd out of the weight setup below
+    with torch.no_grad():
+      params["W_qkv.weight"][:,:] = torch.cat([_MHA_W_Q, _MHA_W_K, _MHA_W_V], dim=0)
+      params["W_qkv.bias"][:] = torch.cat([_MHA_B_Q, _MHA_B_K, _MHA_B_V])
+      params["W_o.weight"][:,:] = _MHA_W_O
+      params["W_o.bias"][:] = _MHA_B_O
 
-    print("Start MultiHeadAttention Params")
+    debug("Start MultiHeadAttention Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param, "requires_grad", param.requires_grad)
-        if param.detach().numpy().sum() == 0:
-          param[0:param.shape[0]] = torch.rand(1, param.shape[0]) 
-    print("End MultiHeadAttention Params")
+        debug("shape:", param.shape)
+        debug(param, "requires_grad", param.requires_grad)
+        if not torch.any(param):
+          torch.nn.init.uniform_(param)
+    debug("End MultiHeadAttention Params")
     
-    A = attention(q, k, v)
-    print("MultiHeadAttention output")
-    print(A)
+    with autocast():
+      A = compiled(attention)(q, k, v)
+    debug("MultiHeadAttention output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,0,0] = 5
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdq", q.grad)
-    print("dAdk", k.grad)
-    print("dAdv", v.grad)
+    debug("dAdq", q.grad)
+    debug("dAdk", k.grad)
+    debug("dAdv", v.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in attention.named_parameters():
-        gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in attention.named_parameters()}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 
 def test_position_wise_feed_forward():
@@ -354,53 +483,54 @@ def test_position_wise_feed_forward():
     )
 
     params = model.state_dict()
-    params["w_1.weight"][:,:] = torch.tensor(
-        [[-0.3883,  0.2742, -0.4652, -0.1417],
-        [-0.0996, -0.4170, -0.0302,  0.1254],
-        [-0.2065,  0.0107,  0.3998,  0.3775]]
-    )
-    params["w_2.weight"][:,:] = torch.tensor(
-        [[ 0.0348,  0.3779, -0.5751],
-        [-0.0708, -0.4522, -0.4000],
-        [ 0.3196,  0.2163,  0.5397],
-        [-0.1805,  0.0472, -0.4630]],
-    )
-    params["w_1.bias"][:] = torch.tensor(
-        [ 0.4282,  0.2099, -0.2209]
-    )
-    params["w_2.bias"][:] = torch.tensor(
-        [-0.4660, -0.4707,  0.4046, -0.4392]
-    )
-
-    print("Start PositionwiseFeedForward Params")
+    # keep autograd out of the weight setup below
+    with torch.no_grad():
+      params["w_1.weight"][:,:] = torch.tensor(
+          [[-0.3883,  0.2742, -0.4652, -0.1417],
+          [-0.0996, -0.4170, -0.0302,  0.1254],
+          [-0.2065,  0.0107,  0.3998,  0.3775]]
+      )
+      params["w_2.weight"][:,:] = torch.tensor(
+          [[ 0.0348,  0.3779, -0.5751],
+          [-0.0708, -0.4522, -0.4000],
+          [ 0.3196,  0.2163,  0.5397],
+          [-0.1805,  0.0472, -0.4630]],
+      )
+      params["w_1.bias"][:] = torch.tensor(
+          [ 0.4282,  0.2099, -0.2209]
+      )
+      params["w_2.bias"][:] = torch.tensor(
+          [-0.4660, -0.4707,  0.4046, -0.4392]
+      )
+
+    debug("Start PositionwiseFeedForward Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param)
-        if param.detach().numpy().sum() == 0:
-          param[0:param.shape[0]] = torch.rand(1, param.shape[0]) 
-    print("End PositionwiseFeedForward Params")
+        debug("shape:", param.shape)
+        debug(param)
+        if not torch.any(param):
+          torch.nn.init.uniform_(param)
+    debug("End PositionwiseFeedForward Params")
 
     A = model(x)
-    print("PositionwiseFeedForward output")
-    print(A)
+    debug("PositionwiseFeedForward output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,0,0] = 5
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdx", x.grad)
+    debug("dAdx", x.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 def test_positional_encoding():
     print("=== test_positional_encoding")
@@ -419,37 +549,36 @@ def test_positional_encoding():
           [0.5300, 0.2800, 0.5306, 0.4950]]],
          requires_grad=True
     )
-    print("x", x)
+    debug("x", x)
 
-    print("Start Params")
+    debug("Start Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param)
-        if param.detach().numpy().sum() == 0:
-          param[0:param.shape[0]] = torch.rand(1, param.shape[0])
-    print("End Params")
+        debug("shape:", param.shape)
+        debug(param)
+        if not torch.any(param):
+          torch.nn.init.uniform_(param)
+    debug("End Params")
 
     A = model(x)
-    print("output")
-    print(A)
+    debug("output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,0,0] = 5
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdx", x.grad)
+    debug("dAdx", x.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 
 def test_grad():
@@ -472,42 +601,36 @@ def test_grad():
 
   # Forward pass
   output = model(input_data)
-  print(f'SimpleModel output')
-  print(output)
+  debug(f'SimpleModel output')
+  debug(output)
 
-  print("Start SimpleModel Params")
+  debug("Start SimpleModel Params")
   params = model.state_dict()
   for name in params:
-      print("name:", name)
+      debug("name:", name)
       param = params[name]
-      print("shape:", param.shape)
-      print(param)
-      if param.detach().numpy().sum() == 0:
-        param[0:param.shape[0]] = torch.rand(1, param.shape[0]) 
-  print("End SimpleModel Params")
+      debug("shape:", param.shape)
+      debug(param)
+      if not torch.any(param):
+        torch.nn.init.uniform_(param)
+  debug("End SimpleModel Params")
 
   # Create a dummy loss (you can use your actual loss function)
   loss = torch.sum(output)
-  print(f'SimpleModel loss')
-  print(loss)
+  debug(f'SimpleModel loss')
+  debug(loss)
 
   dL = torch.ones_like(loss)
-  print("dL.shape", dL.shape)
+  debug("dL.shape", dL.shape)
 
   # Backward pass to compute gradients
   loss.backward(dL)
 
-  # Collect gradients
-  gradients = {}
+  # Report gradients in a single pass over the live parameters; state_dict
+  # tensors are detached copies whose .grad is always None, so walking them
+  # for "missing" gradients only produced false alarms
   for name, param in model.named_parameters():
-      gradients[name] = param.grad.clone()
-
-  # Print or use the gradients as needed
-  for name, grad in gradients.items():
-      print(f'Gradient for {name}:\n{grad}')
-
-  for p in params:
-    print(p, "Missing Grad", params[p].requires_grad, params[p].grad)
+      debug(f'Gradient for {name}:\n{param.grad}')
 
   # Clear gradients for the next iteration (optional)
   model.zero_grad()
@@ -522,17 +645,17 @@ def test_softmax():
     Q = torch.tensor(
         [1.0,2,3],
         requires_grad=True)
-    print("Q", Q)
+    debug("Q", Q)
 
     sQ = torch.softmax(Q, dim=-1)
-    print("softmax(Q)", sQ)
+    debug("softmax(Q)", sQ)
 
     sQ_grad = torch.ones_like(sQ);
     sQ_grad[0] = 5
-    print("softmax(Q).grad", sQ_grad)
+    debug("softmax(Q).grad", sQ_grad)
 
     sQ.backward(sQ_grad)
-    print("Q.grad", Q.grad)
+    debug("Q.grad", Q.grad)
 
 def test_layernorm():
     print("=== test_layernorm")
@@ -543,39 +666,38 @@ def test_layernorm():
          [109.1908, -11.8192,   4.1436,   7.4589],
          [109.9948, -11.8377,   5.3094,   7.9933]]]    
          , requires_grad=True)
-    print("x", x.shape, x)
+    debug("x", x.shape, x)
 
     model = torch.nn.LayerNorm(x.shape[-1]) # row-wise norm
 
-    print("Start Params")
+    debug("Start Params")
     params = model.state_dict()    
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param)
-    print("End Params")
+        debug("shape:", param.shape)
+        debug(param)
+    debug("End Params")
 
     A = model(x)
-    print("output")
-    print(A)
+    debug("output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,0] = 5
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdx", x.grad)
-    print("x.grad", x.grad)
+    debug("dAdx", x.grad)
+    debug("x.grad", x.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 def test_linear():
     print("=== test_linear")
@@ -583,28 +705,30 @@ def test_linear():
         [1.0,2,3],
         [4,5,6],
     ], requires_grad=True)
-    print("x", x)
+    debug("x", x)
 
     model = torch.nn.Linear(3, 4)
 
     params = model.state_dict()
-    params["weight"][:,:] = torch.tensor(
-      [[ 0.5210, -0.3797,  0.2674],
-      [-0.5357, -0.1399,  0.0647],
-      [ 0.3203,  0.0407, -0.3343],
-      [ 0.2107, -0.1692,  0.5243]]
-    )
-    params["bias"][:] = torch.tensor(
-        [ 0.3992,  0.3767,  0.5552, -0.2610]
-    )
+    # keep autograd out of the weight setup below
+    with torch.no_grad():
+      params["weight"][:,:] = torch.tensor(
+        [[ 0.5210, -0.3797,  0.2674],
+        [-0.5357, -0.1399,  0.0647],
+        [ 0.3203,  0.0407, -0.3343],
+        [ 0.2107, -0.1692,  0.5243]]
+      )
+      params["bias"][:] = torch.tensor(
+          [ 0.3992,  0.3767,  0.5552, -0.2610]
+      )
 
     # Collect params
     for name, param in model.named_parameters():
-        print(name)
-        print(param)
+        debug(name)
+        debug(param)
 
     y = model(x)
-    print("y", y)
+    debug("y", y)
 
 
 def test_encoder_layer():
@@ -614,8 +738,16 @@ def test_encoder_layer():
     ff_size = 3
     dropout = 0.0
     
-    model = transformer.EncoderLayer(emb_size, num_heads, ff_size, dropout)
-    params = model.state_dict()
+    # every linear weight below is overwritten with fixed test values, so
+    # skip the default Kaiming/Xavier init: build on the meta device, only
+    # materialize storage, and restore the LayerNorm defaults (a plain
+    # ones/zeros fill with no RNG) that the test relies on
+    with torch.device("meta"):
+      model = transformer.EncoderLayer(emb_size, num_heads, ff_size, dropout)
+    model = model.to_empty(device="cpu")
+    for m in model.modules():
+      if isinstance(m, torch.nn.LayerNorm):
+        m.reset_parameters()
 
     x = torch.tensor(
         [[[1,2,3,4],
@@ -625,93 +757,44 @@ def test_encoder_layer():
           [0.5300, 0.2800, 0.5306, 0.4950]]],
          requires_grad=True
     )
-    print("x", x.shape, x)
+    debug("x", x.shape, x)
     
     # attention mask on q,k.T product
     mask = torch.ones((x.shape[0],x.shape[1],x.shape[1])).bool()
-    print("mask", mask.shape, mask)
+    debug("mask", mask.shape, mask)
 
+    # single load_state_dict call over the dict prebuilt at import;
+    # strict=False leaves the LayerNorms at their ones/zeros defaults
+    model.load_state_dict(_ENC_LAYER_WEIGHTS, strict=False)
     params = model.state_dict()
-    params["self_attn.W_q.weight"][:,:] = torch.tensor(
-            [[-1.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_q.bias"][:] = torch.tensor(
-            [-1.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_k.weight"][:,:] = torch.tensor(
-           [[-2.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_k.bias"][:] = torch.tensor(
-           [-2.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_v.weight"][:,:] = torch.tensor(
-           [[-3.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_v.bias"][:] = torch.tensor(
-           [-3.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_o.weight"][:,:] = torch.tensor(
-           [[-4.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_o.bias"][:] = torch.tensor(
-           [-4.3717, -0.1179, -0.0096, -0.4240])
-    params["feed_forward.w_1.weight"][:,:] = torch.tensor(
-           [[-5.4208,  0.2836, -0.1770,  0.3684],
-            [ 0.3448,  0.4124, -0.2545,  0.2874],
-            [-0.4372,  0.4165, -0.2362,  0.1144]])
-    params["feed_forward.w_1.bias"][:] = torch.tensor(
-            [ 5.2621, -0.3262,  0.4815])
-    params["feed_forward.w_2.weight"][:,:] = torch.tensor(
-            [[-6.3926, -0.1717,  0.2300],
-            [ 0.0701,  0.3166, -0.2458],
-            [ 0.1431, -0.3391,  0.5407],
-            [ 0.4126, -0.3719,  0.5352]])
-    params["feed_forward.w_2.bias"][:] = torch.tensor(
-          [-6.5333, -0.0515, -0.1337,  0.0297])
-    """
-    params["norm1.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm1.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    params["norm2.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm2.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    """
 
-    print("Start Params")
+    debug("Start Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param)
-    print("End Params")
+        debug("shape:", param.shape)
+        debug(param)
+    debug("End Params")
 
-    A = model(x, mask)
-    print("output")
-    print(A)
+    A = compiled(model)(x, mask)
+    debug("output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,0,0] = 1250
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdx", x.grad)
+    debug("dAdx", x.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        if param.grad is not None:
-          gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()
+                 if p.grad is not None}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 
 def test_decoder_layer():
@@ -721,8 +804,13 @@ def test_decoder_layer():
     ff_size = 3
     dropout = 0.0
     
-    model = transformer.DecoderLayer(emb_size, num_heads, ff_size, dropout)
-    params = model.state_dict()
+    # as in test_encoder_layer, skip the overwritten default init
+    with torch.device("meta"):
+      model = transformer.DecoderLayer(emb_size, num_heads, ff_size, dropout)
+    model = model.to_empty(device="cpu")
+    for m in model.modules():
+      if isinstance(m, torch.nn.LayerNorm):
+        m.reset_parameters()
 
     e = torch.tensor([[
         [-1.7227,  0.4192,  0.5928,  0.7106],
@@ -739,8 +827,8 @@ def test_decoder_layer():
         [-0.3883,  0.2742, -0.4652, -0.1417],
         [0.5300, 0.2800, 0.5306, 0.4950],
         ]], requires_grad=True)
-    print("e", e.shape, e)
-    print("x", x.shape, x)
+    debug("e", e.shape, e)
+    debug("x", x.shape, x)
     
     # attention masks
     src_mask = torch.ones((x.shape[0],x.shape[1],x.shape[1])).bool()
@@ -751,121 +839,41 @@ def test_decoder_layer():
         [1,1,1,1,0],
         [1,1,1,1,1],
         ]]).bool()
-    print("src_mask", src_mask.shape, src_mask)
-    print("tgt_mask", tgt_mask.shape, tgt_mask)
+    debug("src_mask", src_mask.shape, src_mask)
+    debug("tgt_mask", tgt_mask.shape, tgt_mask)
 
+    # single load_state_dict call, see test_encoder_layer
+    model.load_state_dict(_DEC_LAYER_WEIGHTS, strict=False)
     params = model.state_dict()
-    params["self_attn.W_q.weight"][:,:] = torch.tensor(
-            [[-1.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_q.bias"][:] = torch.tensor(
-            [-1.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_k.weight"][:,:] = torch.tensor(
-           [[-2.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_k.bias"][:] = torch.tensor(
-           [-2.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_v.weight"][:,:] = torch.tensor(
-           [[-3.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_v.bias"][:] = torch.tensor(
-           [-3.3717, -0.1179, -0.0096, -0.4240])
-    params["self_attn.W_o.weight"][:,:] = torch.tensor(
-           [[-4.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["self_attn.W_o.bias"][:] = torch.tensor(
-           [-4.3717, -0.1179, -0.0096, -0.4240])
-        
-    params["cross_attn.W_q.weight"][:,:] = torch.tensor(
-       [[ 0.0675,  0.0034,  0.2860, -0.0438],
-        [ 0.3234,  0.4208, -0.0814, -0.0883],
-        [-0.3376,  0.2880,  0.0641, -0.4295],
-        [ 0.4480,  0.4328, -0.4657,  0.1207]])
-    params["cross_attn.W_q.bias"][:] = torch.tensor(
-        [-0.3390,  0.0716,  0.4804, -0.4253])
-    params["cross_attn.W_k.weight"][:,:] = torch.tensor(
-       [[ 0.2975,  0.0247,  0.4618, -0.1429],
-        [-0.0016, -0.0542, -0.3919,  0.1051],
-        [ 0.4285,  0.0760, -0.3002, -0.2579],
-        [-0.1038,  0.4511,  0.4412,  0.2605]])
-    params["cross_attn.W_k.bias"][:] = torch.tensor(
-        [-0.3793,  0.4552,  0.1502,  0.3554])
-    params["cross_attn.W_v.weight"][:,:] = torch.tensor(
-       [[-0.4192, -0.4004,  0.0120, -0.4717],
-        [-0.3308, -0.4728, -0.1381,  0.3374],
-        [ 0.1521, -0.1548,  0.2885,  0.4352],
-        [-0.1196, -0.2579, -0.3167,  0.0128]])
-    params["cross_attn.W_v.bias"][:] = torch.tensor(
-        [0.4992, -0.2558,  0.1871, -0.3701])
-    params["cross_attn.W_o.weight"][:,:] = torch.tensor(
-       [[ 1.5146e-01,  5.0816e-02,  3.9053e-04, -4.6405e-01],
-        [-1.2832e-01, -4.3910e-01, -1.8390e-01, -5.1324e-02],
-        [ 4.4734e-01, -3.3816e-01,  1.3738e-01, -1.3041e-01],
-        [ 1.8204e-01, -2.9708e-01,  3.2434e-01, -6.3109e-02]])
-    params["cross_attn.W_o.bias"][:] = torch.tensor(
-        [-0.4427, -0.0959, -0.2821, -0.2209])
-        
-    params["feed_forward.w_1.weight"][:,:] = torch.tensor(
-           [[-5.4208,  0.2836, -0.1770,  0.3684],
-            [ 0.3448,  0.4124, -0.2545,  0.2874],
-            [-0.4372,  0.4165, -0.2362,  0.1144]])
-    params["feed_forward.w_1.bias"][:] = torch.tensor(
-            [ 5.2621, -0.3262,  0.4815])
-    params["feed_forward.w_2.weight"][:,:] = torch.tensor(
-            [[-6.3926, -0.1717,  0.2300],
-            [ 0.0701,  0.3166, -0.2458],
-            [ 0.1431, -0.3391,  0.5407],
-            [ 0.4126, -0.3719,  0.5352]])
-    params["feed_forward.w_2.bias"][:] = torch.tensor(
-          [-6.5333, -0.0515, -0.1337,  0.0297])
-    """
-    params["norm1.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm1.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    params["norm2.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm2.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    """
 
-    print("Start Params")
+    debug("Start Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
-        print(param)
-    print("End Params")
+        debug("shape:", param.shape)
+        debug(param)
+    debug("End Params")
 
-    A = model(x, e, src_mask, tgt_mask)
-    print("output")
-    print(A)
+    A = compiled(model)(x, e, src_mask, tgt_mask)
+    debug("output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,:,0] = 1250
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
-    print("dAdx", x.grad)
-    print("dAde", e.grad)
+    debug("dAdx", x.grad)
+    debug("dAde", e.grad)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        if param.grad is not None:
-          gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()
+                 if p.grad is not None}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 def test_transformer():
     print("=== test_transformer")
@@ -883,7 +891,6 @@ def test_transformer():
     
     model = transformer.Transformer(src_vocab_size, tgt_vocab_size,
       emb_size, num_heads, num_layers, ff_size, max_seq_length, dropout)
-    params = model.state_dict()
 
     src = torch.tensor([
         [1, 2, 3, pad_token, pad_token],
@@ -892,223 +899,59 @@ def test_transformer():
     tgt = torch.tensor([
         [sos_token, 1, 2, 3, pad_token],
         ], requires_grad=False)
-    print("src", src.shape, src)
-    print("tgt", tgt.shape, tgt)
-
+    debug("src", src.shape, src)
+    debug("tgt", tgt.shape, tgt)
+
+    # single load_state_dict call over the dict prebuilt at import;
+    # strict=False skips the LayerNorms (defaults) and the precomputed
+    # positional_encoding.pe constant
+    model.load_state_dict(_TRANSFORMER_WEIGHTS, strict=False)
+    if DTYPE is not torch.float32:
+      # optional reduced-precision run, cast after the fp32 load so the
+      # stored literals keep full printed parity by default
+      model = model.to(DTYPE)
     params = model.state_dict()
 
-    # embeddings
-    params["encoder_embedding.weight"][:,:] = torch.tensor(
-        [[-1.5104, -0.0284,  0.8700,  0.8670],
-        [ 1.1990,  1.1361,  0.8644,  0.1473],
-        [-0.7335,  0.3807,  0.7741,  0.4396],
-        [-0.7043,  1.6892, -0.5124,  0.4657],
-        [ 0.0162, -1.9550,  1.6194,  1.5560],
-        [ 1.3285,  0.2094, -1.5481,  0.2234],
-        [-0.8587, -0.4757,  0.1260, -1.9552],
-        [-0.7352, -0.9533, -0.7015, -1.8978],
-        [-0.3166,  1.9976,  0.1297,  0.9044],
-        [ 0.7586, -1.0734, -0.4338, -0.8578]])    
-    params["decoder_embedding.weight"][:,:] = torch.tensor(
-        [[-0.5281,  0.1697, -0.9366,  0.0129],
-        [ 0.1969, -1.1860,  0.0961, -0.6315],
-        [-0.1603, -0.1080,  0.1573,  0.9020],
-        [ 1.2745,  0.0302,  1.0822, -0.4542],
-        [-0.5246, -0.9769, -0.6335,  2.4609],
-        [-0.7565,  1.0006, -1.5738,  1.5421],
-        [-0.7897, -3.4246,  0.4188, -1.1293],
-        [ 0.9453, -0.1520, -0.7238,  0.7383],
-        [ 0.0729,  0.3859,  0.0163, -0.9825],
-        [-0.9148,  1.0367, -1.0432,  1.4304]])
-
-    # positional_encoding.pe is precomputed constant
-
-    # encoder
-
-    params["encoder_layers.0.self_attn.W_q.weight"][:,:] = torch.tensor(
-            [[-1.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["encoder_layers.0.self_attn.W_q.bias"][:] = torch.tensor(
-            [-1.3717, -0.1179, -0.0096, -0.4240])
-    params["encoder_layers.0.self_attn.W_k.weight"][:,:] = torch.tensor(
-           [[-2.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["encoder_layers.0.self_attn.W_k.bias"][:] = torch.tensor(
-           [-2.3717, -0.1179, -0.0096, -0.4240])
-    params["encoder_layers.0.self_attn.W_v.weight"][:,:] = torch.tensor(
-           [[-3.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["encoder_layers.0.self_attn.W_v.bias"][:] = torch.tensor(
-           [-3.3717, -0.1179, -0.0096, -0.4240])
-    params["encoder_layers.0.self_attn.W_o.weight"][:,:] = torch.tensor(
-           [[-4.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["encoder_layers.0.self_attn.W_o.bias"][:] = torch.tensor(
-           [-4.3717, -0.1179, -0.0096, -0.4240])
-    params["encoder_layers.0.feed_forward.w_1.weight"][:,:] = torch.tensor(
-           [[-5.4208,  0.2836, -0.1770,  0.3684],
-            [ 0.3448,  0.4124, -0.2545,  0.2874],
-            [-0.4372,  0.4165, -0.2362,  0.1144]])
-    params["encoder_layers.0.feed_forward.w_1.bias"][:] = torch.tensor(
-            [ 5.2621, -0.3262,  0.4815])
-    params["encoder_layers.0.feed_forward.w_2.weight"][:,:] = torch.tensor(
-            [[-6.3926, -0.1717,  0.2300],
-            [ 0.0701,  0.3166, -0.2458],
-            [ 0.1431, -0.3391,  0.5407],
-            [ 0.4126, -0.3719,  0.5352]])
-    params["encoder_layers.0.feed_forward.w_2.bias"][:] = torch.tensor(
-          [-6.5333, -0.0515, -0.1337,  0.0297])
-
-    # decoder
-
-    params["decoder_layers.0.self_attn.W_q.weight"][:,:] = torch.tensor(
-            [[-1.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["decoder_layers.0.self_attn.W_q.bias"][:] = torch.tensor(
-            [-1.3717, -0.1179, -0.0096, -0.4240])
-    params["decoder_layers.0.self_attn.W_k.weight"][:,:] = torch.tensor(
-           [[-2.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["decoder_layers.0.self_attn.W_k.bias"][:] = torch.tensor(
-           [-2.3717, -0.1179, -0.0096, -0.4240])
-    params["decoder_layers.0.self_attn.W_v.weight"][:,:] = torch.tensor(
-           [[-3.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["decoder_layers.0.self_attn.W_v.bias"][:] = torch.tensor(
-           [-3.3717, -0.1179, -0.0096, -0.4240])
-    params["decoder_layers.0.self_attn.W_o.weight"][:,:] = torch.tensor(
-           [[-4.2321, -0.4785, -0.4598, -0.1860],
-            [ 0.4576,  0.4961, -0.0903, -0.4833],
-            [-0.1442,  0.3495,  0.4236, -0.0846],
-            [-0.3082,  0.0956, -0.2470,  0.3061]])
-    params["decoder_layers.0.self_attn.W_o.bias"][:] = torch.tensor(
-           [-4.3717, -0.1179, -0.0096, -0.4240])
-        
-    params["decoder_layers.0.cross_attn.W_q.weight"][:,:] = torch.tensor(
-       [[ 0.0675,  0.0034,  0.2860, -0.0438],
-        [ 0.3234,  0.4208, -0.0814, -0.0883],
-        [-0.3376,  0.2880,  0.0641, -0.4295],
-        [ 0.4480,  0.4328, -0.4657,  0.1207]])
-    params["decoder_layers.0.cross_attn.W_q.bias"][:] = torch.tensor(
-        [-0.3390,  0.0716,  0.4804, -0.4253])
-    params["decoder_layers.0.cross_attn.W_k.weight"][:,:] = torch.tensor(
-       [[ 0.2975,  0.0247,  0.4618, -0.1429],
-        [-0.0016, -0.0542, -0.3919,  0.1051],
-        [ 0.4285,  0.0760, -0.3002, -0.2579],
-        [-0.1038,  0.4511,  0.4412,  0.2605]])
-    params["decoder_layers.0.cross_attn.W_k.bias"][:] = torch.tensor(
-        [-0.3793,  0.4552,  0.1502,  0.3554])
-    params["decoder_layers.0.cross_attn.W_v.weight"][:,:] = torch.tensor(
-       [[-0.4192, -0.4004,  0.0120, -0.4717],
-        [-0.3308, -0.4728, -0.1381,  0.3374],
-        [ 0.1521, -0.1548,  0.2885,  0.4352],
-        [-0.1196, -0.2579, -0.3167,  0.0128]])
-    params["decoder_layers.0.cross_attn.W_v.bias"][:] = torch.tensor(
-        [0.4992, -0.2558,  0.1871, -0.3701])
-    params["decoder_layers.0.cross_attn.W_o.weight"][:,:] = torch.tensor(
-       [[ 1.5146e-01,  5.0816e-02,  3.9053e-04, -4.6405e-01],
-        [-1.2832e-01, -4.3910e-01, -1.8390e-01, -5.1324e-02],
-        [ 4.4734e-01, -3.3816e-01,  1.3738e-01, -1.3041e-01],
-        [ 1.8204e-01, -2.9708e-01,  3.2434e-01, -6.3109e-02]])
-    params["decoder_layers.0.cross_attn.W_o.bias"][:] = torch.tensor(
-        [-0.4427, -0.0959, -0.2821, -0.2209])
-        
-    params["decoder_layers.0.feed_forward.w_1.weight"][:,:] = torch.tensor(
-           [[-5.4208,  0.2836, -0.1770,  0.3684],
-            [ 0.3448,  0.4124, -0.2545,  0.2874],
-            [-0.4372,  0.4165, -0.2362,  0.1144]])
-    params["decoder_layers.0.feed_forward.w_1.bias"][:] = torch.tensor(
-            [ 5.2621, -0.3262,  0.4815])
-    params["decoder_layers.0.feed_forward.w_2.weight"][:,:] = torch.tensor(
-            [[-6.3926, -0.1717,  0.2300],
-            [ 0.0701,  0.3166, -0.2458],
-            [ 0.1431, -0.3391,  0.5407],
-            [ 0.4126, -0.3719,  0.5352]])
-    params["decoder_layers.0.feed_forward.w_2.bias"][:] = torch.tensor(
-          [-6.5333, -0.0515, -0.1337,  0.0297])
-    """
-    params["norm1.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm1.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    params["norm2.weight"][:] = torch.tensor(
-          [1., 1., 1., 1.])
-    params["norm2.bias"][:] = torch.tensor(
-          [0., 0., 0., 0.])
-    """
-    
-    # fc
-
-    params["fc.weight"][:,:] = torch.tensor(
-        [[ 0.4024,  0.2209, -0.3322, -0.2039],
-        [-0.0586, -0.3453, -0.4044,  0.3376],
-        [-0.4428,  0.0175, -0.4929, -0.2737],
-        [-0.4433, -0.2716, -0.0390,  0.4631],
-        [-0.0599,  0.1389,  0.0554, -0.2265],
-        [-0.4810, -0.2936,  0.2530, -0.0608],
-        [ 0.1361,  0.1135, -0.1584, -0.0923],
-        [ 0.3696, -0.2719, -0.0755,  0.3822],
-        [-0.2697,  0.1172, -0.0242,  0.4085],
-        [-0.2495, -0.1300,  0.2470,  0.3172]])
-    params["fc.bias"][:] = torch.tensor(
-        [ 0.1317, -0.1626, -0.0434, -0.4033,  0.0458, -0.1930,  0.3019, -0.3306,
-        -0.1221,  0.3670])
-
-    print("Start Params")
+    debug("Start Params")
     for name in params:
-        print("name:", name)
+        debug("name:", name)
         param = params[name]
-        print("shape:", param.shape)
+        debug("shape:", param.shape)
         #print(param)
-    print("End Params")
+    debug("End Params")
 
-    A = model(src, tgt)
-    print("output")
-    print(A)
+    A, _ = compiled(model)(src, tgt, pad_token)
+    debug("output")
+    debug(A)
 
     dA = torch.ones_like(A)
     dA[0,:,0] = 1250
-    print("dA", dA)
+    debug("dA", dA)
 
     A.backward(dA)
 
-    # Collect gradients
-    gradients = {}
-    for name, param in model.named_parameters():
-        if param.grad is not None:
-          gradients[name] = param.grad.clone()
+    # Collect gradients (detached views: nothing mutates them before use,
+    # so there is no need to clone every tensor)
+    gradients = {n: p.grad.detach() for n, p in model.named_parameters()
+                 if p.grad is not None}
 
     # Print or use the gradients as needed
     for name, grad in gradients.items():
-        print(f'Gradient for {name}:\n{grad}')
+        debug(f'Gradient for {name}:\n{grad}')
 
 def test_sequence_mask():
   print("=== test_sequence_mask")
   pad = 0
   src = torch.tensor([[1,2,3,4,pad]])
   tgt = torch.tensor([[1,2,3,0,pad]])
-  print("src\n", src)
-  print("tgt\n", tgt)
+  debug("src\n", src)
+  debug("tgt\n", tgt)
 
   mask = transformer.SeqeunceMask(pad, pad)
   src_mask = mask.make_src_mask(src)
   tgt_mask = mask.make_tgt_mask(tgt)
-  print("src_mask\n", src_mask)
-  print("tgt_mask\n", tgt_mask)
+  debug("src_mask\n", src_mask)
+  debug("tgt_mask\n", tgt_mask)
 
 def save_model_as_numpy(torch_state_dict, numpy_path):
   model_dict = collections.OrderedDict()
@@ -1118,10 +961,13 @@ def save_model_as_numpy(torch_state_dict, numpy_path):
   np.savez(numpy_path, **model_dict)
 
 def save_model_as_torch(numpy_state_dict, torch_path):
+  # from_numpy wraps each array in place (ascontiguousarray is a no-op for
+  # C-ordered input), so building the dict moves no weight bytes; torch.save
+  # already writes the storages as raw blocks in its zip container
   model_dict = collections.OrderedDict()
   for m in numpy_state_dict:
     arr = numpy_state_dict[m]
-    model_dict[m] = torch.FloatTensor(arr)
+    model_dict[m] = torch.from_numpy(np.ascontiguousarray(arr))
   torch.save(model_dict, torch_path)
 
 def test_model_conversion():
@@ -1131,333 +977,196 @@ def test_model_conversion():
   print("=== torch ===")
   torch_dics = torch.load(torch_model_path)
   torch.save(torch_dics, torch_model_path + "1")
-  print(type(torch_dics))
+  debug(type(torch_dics))
   #for d in torch_dics:
   #  print(type(d), d, type(torch_dics[d]), torch_dics[d].shape)
   a = torch_dics["fc.weight"]
-  print("fc.weight", a.dtype, a.shape, a)
+  debug("fc.weight", a.dtype, a.shape, a)
 
   print("=== numpy ===")
   numpy_dics = np.load(numpy_model_path)
-  print(type(numpy_dics))
+  debug(type(numpy_dics))
   #for d in numpy_dics:
   #  print(type(d), d, type(numpy_dics[d]), numpy_dics[d].shape)
   a = numpy_dics["fc.weight"]
-  print("fc.weight", a.dtype, a.shape, a)
+  debug("fc.weight", a.dtype, a.shape, a)
   save_model_as_torch(numpy_dics, torch_model_path + "2")
 
   print("=== torch 2 ===")
   torch_dics = torch.load(torch_model_path + "2")
-  print(type(torch_dics))
+  debug(type(torch_dics))
   #for d in torch_dics:
   #  print(type(d), d, type(torch_dics[d]), torch_dics[d].shape)
   a = torch_dics["fc.weight"]
-  print("fc.weight", a.dtype, a.shape, a)
+  debug("fc.weight", a.dtype, a.shape, a)
 
   pt1 = torch.load(torch_model_path + "1")
   pt2 = torch.load(torch_model_path + "2")
 
+  def tensors_equal(d1, d2):
+    # cheap metadata checks first; aliasing tensors skip the element walk
+    if d1.shape != d2.shape or d1.dtype != d2.dtype:
+      return False
+    return d1.data_ptr() == d2.data_ptr() or torch.equal(d1, d2)
+
   for p in pt2:
     d1 = pt1[p]
     d2 = pt2[p]
-    if not torch.equal(d1, d2):
-      print(d, d1.dtype, d1.shape, d2.dtype, d2.shape)
+    if not tensors_equal(d1, d2):
+      print(p, d1.dtype, d1.shape, d2.dtype, d2.shape)
+
+def _build_name_map(num_layers=6):
+  # CPP graph names are auto-numbered in creation order: the first instance
+  # of a type is unsuffixed, later ones get .1, .2, ... -- encoder and
+  # decoder each count their own MHA/Linear/Norm instances
+  def cpp(prefix, index):
+    return prefix if index == 0 else f"{prefix}.{index}"
+
+  def mha(torch_prefix, side, index):
+    return {
+      f"{torch_prefix}.W_qkv.weight": tuple(cpp(f"{side}:MHA.W{x}", index) for x in "qkv"),
+      f"{torch_prefix}.W_qkv.bias": tuple(cpp(f"{side}:MHA.b{x}", index) for x in "qkv"),
+      f"{torch_prefix}.W_o.weight": cpp(f"{side}:MHA.Wo", index),
+      f"{torch_prefix}.W_o.bias": cpp(f"{side}:MHA.bo", index),
+    }
+
+  def ffn(torch_prefix, side, index):
+    return {
+      f"{torch_prefix}.w_1.weight": cpp(f"{side}:Linear.W", 2 * index),
+      f"{torch_prefix}.w_1.bias": cpp(f"{side}:Linear.b", 2 * index),
+      f"{torch_prefix}.w_2.weight": cpp(f"{side}:Linear.W", 2 * index + 1),
+      f"{torch_prefix}.w_2.bias": cpp(f"{side}:Linear.b", 2 * index + 1),
+    }
+
+  def norm(torch_prefix, side, index):
+    return {
+      f"{torch_prefix}.weight": cpp(f"{side}:Norm.A", index),
+      f"{torch_prefix}.bias": cpp(f"{side}:Norm.B", index),
+    }
 
-def numpy_model_to_torch_model(numpy_vars, torch_vars):
-  # map Torch weight names to CPP weight names
   name_map = {
     "encoder_embedding.weight": "Embedding.E",
     "decoder_embedding.weight": "Embedding.E.1",
-    "positional_encoding.pe": None, # constant (hardcoded value)
-    "encoder_layers.0.self_attn.W_q.weight": "encoder:MHA.Wq",
-    "encoder_layers.0.self_attn.W_q.bias": "encoder:MHA.bq",
-    "encoder_layers.0.self_attn.W_k.weight": "encoder:MHA.Wk",
-    "encoder_layers.0.self_attn.W_k.bias": "encoder:MHA.bk",
-    "encoder_layers.0.self_attn.W_v.weight": "encoder:MHA.Wv",
-    "encoder_layers.0.self_attn.W_v.bias": "encoder:MHA.bv",
-    "encoder_layers.0.self_attn.W_o.weight": "encoder:MHA.Wo",
-    "encoder_layers.0.self_attn.W_o.bias": "encoder:MHA.bo",
-    "encoder_layers.0.feed_forward.w_1.weight": "encoder:Linear.W",
-    "encoder_layers.0.feed_forward.w_1.bias": "encoder:Linear.b",
-    "encoder_layers.0.feed_forward.w_2.weight": "encoder:Linear.W.1",
-    "encoder_layers.0.feed_forward.w_2.bias": "encoder:Linear.b.1",
-    "encoder_layers.0.norm1.weight": "encoder:Norm.A",
-    "encoder_layers.0.norm1.bias": "encoder:Norm.B",
-    "encoder_layers.0.norm2.weight": "encoder:Norm.A.1",
-    "encoder_layers.0.norm2.bias": "encoder:Norm.B.1",
-    "encoder_layers.1.self_attn.W_q.weight": "encoder:MHA.Wq.1",
-    "encoder_layers.1.self_attn.W_q.bias": "encoder:MHA.bq.1",
-    "encoder_layers.1.self_attn.W_k.weight": "encoder:MHA.Wk.1",
-    "encoder_layers.1.self_attn.W_k.bias": "encoder:MHA.bk.1",
-    "encoder_layers.1.self_attn.W_v.weight": "encoder:MHA.Wv.1",
-    "encoder_layers.1.self_attn.W_v.bias": "encoder:MHA.bv.1",
-    "encoder_layers.1.self_attn.W_o.weight": "encoder:MHA.Wo.1",
-    "encoder_layers.1.self_attn.W_o.bias": "encoder:MHA.bo.1",
-    "encoder_layers.1.feed_forward.w_1.weight": "encoder:Linear.W.2",
-    "encoder_layers.1.feed_forward.w_1.bias": "encoder:Linear.b.2",
-    "encoder_layers.1.feed_forward.w_2.weight": "encoder:Linear.W.3",
-    "encoder_layers.1.feed_forward.w_2.bias": "encoder:Linear.b.3",
-    "encoder_layers.1.norm1.weight": "encoder:Norm.A.2",
-    "encoder_layers.1.norm1.bias": "encoder:Norm.B.2",
-    "encoder_layers.1.norm2.weight": "encoder:Norm.A.3",
-    "encoder_layers.1.norm2.bias": "encoder:Norm.B.3",
-    "encoder_layers.2.self_attn.W_q.weight": "encoder:MHA.Wq.2",
-    "encoder_layers.2.self_attn.W_q.bias": "encoder:MHA.bq.2",
-    "encoder_layers.2.self_attn.W_k.weight": "encoder:MHA.Wk.2",
-    "encoder_layers.2.self_attn.W_k.bias": "encoder:MHA.bk.2",
-    "encoder_layers.2.self_attn.W_v.weight": "encoder:MHA.Wv.2",
-    "encoder_layers.2.self_attn.W_v.bias": "encoder:MHA.bv.2",
-    "encoder_layers.2.self_attn.W_o.weight": "encoder:MHA.Wo.2",
-    "encoder_layers.2.self_attn.W_o.bias": "encoder:MHA.bo.2",
-    "encoder_layers.2.feed_forward.w_1.weight": "encoder:Linear.W.4",
-    "encoder_layers.2.feed_forward.w_1.bias": "encoder:Linear.b.4",
-    "encoder_layers.2.feed_forward.w_2.weight": "encoder:Linear.W.5",
-    "encoder_layers.2.feed_forward.w_2.bias": "encoder:Linear.b.5",
-    "encoder_layers.2.norm1.weight": "encoder:Norm.A.4",
-    "encoder_layers.2.norm1.bias": "encoder:Norm.B.4",
-    "encoder_layers.2.norm2.weight": "encoder:Norm.A.5",
-    "encoder_layers.2.norm2.bias": "encoder:Norm.B.5",
-    "encoder_layers.3.self_attn.W_q.weight": "encoder:MHA.Wq.3",
-    "encoder_layers.3.self_attn.W_q.bias": "encoder:MHA.bq.3",
-    "encoder_layers.3.self_attn.W_k.weight": "encoder:MHA.Wk.3",
-    "encoder_layers.3.self_attn.W_k.bias": "encoder:MHA.bk.3",
-    "encoder_layers.3.self_attn.W_v.weight": "encoder:MHA.Wv.3",
-    "encoder_layers.3.self_attn.W_v.bias": "encoder:MHA.bv.3",
-    "encoder_layers.3.self_attn.W_o.weight": "encoder:MHA.Wo.3",
-    "encoder_layers.3.self_attn.W_o.bias": "encoder:MHA.bo.3",
-    "encoder_layers.3.feed_forward.w_1.weight": "encoder:Linear.W.6",
-    "encoder_layers.3.feed_forward.w_1.bias": "encoder:Linear.b.6",
-    "encoder_layers.3.feed_forward.w_2.weight": "encoder:Linear.W.7",
-    "encoder_layers.3.feed_forward.w_2.bias": "encoder:Linear.b.7",
-    "encoder_layers.3.norm1.weight": "encoder:Norm.A.6",
-    "encoder_layers.3.norm1.bias": "encoder:Norm.B.6",
-    "encoder_layers.3.norm2.weight": "encoder:Norm.A.7",
-    "encoder_layers.3.norm2.bias": "encoder:Norm.B.7",
-    "encoder_layers.4.self_attn.W_q.weight": "encoder:MHA.Wq.4",
-    "encoder_layers.4.self_attn.W_q.bias": "encoder:MHA.bq.4",
-    "encoder_layers.4.self_attn.W_k.weight": "encoder:MHA.Wk.4",
-    "encoder_layers.4.self_attn.W_k.bias": "encoder:MHA.bk.4",
-    "encoder_layers.4.self_attn.W_v.weight": "encoder:MHA.Wv.4",
-    "encoder_layers.4.self_attn.W_v.bias": "encoder:MHA.bv.4",
-    "encoder_layers.4.self_attn.W_o.weight": "encoder:MHA.Wo.4",
-    "encoder_layers.4.self_attn.W_o.bias": "encoder:MHA.bo.4",
-    "encoder_layers.4.feed_forward.w_1.weight": "encoder:Linear.W.8",
-    "encoder_layers.4.feed_forward.w_1.bias": "encoder:Linear.b.8",
-    "encoder_layers.4.feed_forward.w_2.weight": "encoder:Linear.W.9",
-    "encoder_layers.4.feed_forward.w_2.bias": "encoder:Linear.b.9",
-    "encoder_layers.4.norm1.weight": "encoder:Norm.A.8",
-    "encoder_layers.4.norm1.bias": "encoder:Norm.B.8",
-    "encoder_layers.4.norm2.weight": "encoder:Norm.A.9",
-    "encoder_layers.4.norm2.bias": "encoder:Norm.B.9",
-    "encoder_layers.5.self_attn.W_q.weight": "encoder:MHA.Wq.5",
-    "encoder_layers.5.self_attn.W_q.bias": "encoder:MHA.bq.5",
-    "encoder_layers.5.self_attn.W_k.weight": "encoder:MHA.Wk.5",
-    "encoder_layers.5.self_attn.W_k.bias": "encoder:MHA.bk.5",
-    "encoder_layers.5.self_attn.W_v.weight": "encoder:MHA.Wv.5",
-    "encoder_layers.5.self_attn.W_v.bias": "encoder:MHA.bv.5",
-    "encoder_layers.5.self_attn.W_o.weight": "encoder:MHA.Wo.5",
-    "encoder_layers.5.self_attn.W_o.bias": "encoder:MHA.bo.5",
-    "encoder_layers.5.feed_forward.w_1.weight": "encoder:Linear.W.10",
-    "encoder_layers.5.feed_forward.w_1.bias": "encoder:Linear.b.10",
-    "encoder_layers.5.feed_forward.w_2.weight": "encoder:Linear.W.11",
-    "encoder_layers.5.feed_forward.w_2.bias": "encoder:Linear.b.11",
-    "encoder_layers.5.norm1.weight": "encoder:Norm.A.10",
-    "encoder_layers.5.norm1.bias": "encoder:Norm.B.10",
-    "encoder_layers.5.norm2.weight": "encoder:Norm.A.11",
-    "encoder_layers.5.norm2.bias": "encoder:Norm.B.11",
-    "decoder_layers.0.self_attn.W_q.weight": "decoder:MHA.Wq",
-    "decoder_layers.0.self_attn.W_q.bias": "decoder:MHA.bq",
-    "decoder_layers.0.self_attn.W_k.weight": "decoder:MHA.Wk",
-    "decoder_layers.0.self_attn.W_k.bias": "decoder:MHA.bk",
-    "decoder_layers.0.self_attn.W_v.weight": "decoder:MHA.Wv",
-    "decoder_layers.0.self_attn.W_v.bias": "decoder:MHA.bv",
-    "decoder_layers.0.self_attn.W_o.weight": "decoder:MHA.Wo",
-    "decoder_layers.0.self_attn.W_o.bias": "decoder:MHA.bo",
-    "decoder_layers.0.cross_attn.W_q.weight": "decoder:MHA.Wq.1",
-    "decoder_layers.0.cross_attn.W_q.bias": "decoder:MHA.bq.1",
-    "decoder_layers.0.cross_attn.W_k.weight": "decoder:MHA.Wk.1",
-    "decoder_layers.0.cross_attn.W_k.bias": "decoder:MHA.bk.1",
-    "decoder_layers.0.cross_attn.W_v.weight": "decoder:MHA.Wv.1",
-    "decoder_layers.0.cross_attn.W_v.bias": "decoder:MHA.bv.1",
-    "decoder_layers.0.cross_attn.W_o.weight": "decoder:MHA.Wo.1",
-    "decoder_layers.0.cross_attn.W_o.bias": "decoder:MHA.bo.1",
-    "decoder_layers.0.feed_forward.w_1.weight": "decoder:Linear.W",
-    "decoder_layers.0.feed_forward.w_1.bias": "decoder:Linear.b",
-    "decoder_layers.0.feed_forward.w_2.weight": "decoder:Linear.W.1",
-    "decoder_layers.0.feed_forward.w_2.bias": "decoder:Linear.b.1",
-    "decoder_layers.0.norm1.weight": "decoder:Norm.A",
-    "decoder_layers.0.norm1.bias": "decoder:Norm.B",
-    "decoder_layers.0.norm2.weight": "decoder:Norm.A.1",
-    "decoder_layers.0.norm2.bias": "decoder:Norm.B.1",
-    "decoder_layers.0.norm3.weight": "decoder:Norm.A.2",
-    "decoder_layers.0.norm3.bias": "decoder:Norm.B.2",
-    "decoder_layers.1.self_attn.W_q.weight": "decoder:MHA.Wq.2",
-    "decoder_layers.1.self_attn.W_q.bias": "decoder:MHA.bq.2",
-    "decoder_layers.1.self_attn.W_k.weight": "decoder:MHA.Wk.2",
-    "decoder_layers.1.self_attn.W_k.bias": "decoder:MHA.bk.2",
-    "decoder_layers.1.self_attn.W_v.weight": "decoder:MHA.Wv.2",
-    "decoder_layers.1.self_attn.W_v.bias": "decoder:MHA.bv.2",
-    "decoder_layers.1.self_attn.W_o.weight": "decoder:MHA.Wo.2",
-    "decoder_layers.1.self_attn.W_o.bias": "decoder:MHA.bo.2",
-    "decoder_layers.1.cross_attn.W_q.weight": "decoder:MHA.Wq.3",
-    "decoder_layers.1.cross_attn.W_q.bias": "decoder:MHA.bq.3",
-    "decoder_layers.1.cross_attn.W_k.weight": "decoder:MHA.Wk.3",
-    "decoder_layers.1.cross_attn.W_k.bias": "decoder:MHA.bk.3",
-    "decoder_layers.1.cross_attn.W_v.weight": "decoder:MHA.Wv.3",
-    "decoder_layers.1.cross_attn.W_v.bias": "decoder:MHA.bv.3",
-    "decoder_layers.1.cross_attn.W_o.weight": "decoder:MHA.Wo.3",
-    "decoder_layers.1.cross_attn.W_o.bias": "decoder:MHA.bo.3",
-    "decoder_layers.1.feed_forward.w_1.weight": "decoder:Linear.W.2",
-    "decoder_layers.1.feed_forward.w_1.bias": "decoder:Linear.b.2",
-    "decoder_layers.1.feed_forward.w_2.weight": "decoder:Linear.W.3",
-    "decoder_layers.1.feed_forward.w_2.bias": "decoder:Linear.b.3",
-    "decoder_layers.1.norm1.weight": "decoder:Norm.A.3",
-    "decoder_layers.1.norm1.bias": "decoder:Norm.B.3",
-    "decoder_layers.1.norm2.weight": "decoder:Norm.A.4",
-    "decoder_layers.1.norm2.bias": "decoder:Norm.B.4",
-    "decoder_layers.1.norm3.weight": "decoder:Norm.A.5",
-    "decoder_layers.1.norm3.bias": "decoder:Norm.B.5",
-    "decoder_layers.2.self_attn.W_q.weight": "decoder:MHA.Wq.4",
-    "decoder_layers.2.self_attn.W_q.bias": "decoder:MHA.bq.4",
-    "decoder_layers.2.self_attn.W_k.weight": "decoder:MHA.Wk.4",
-    "decoder_layers.2.self_attn.W_k.bias": "decoder:MHA.bk.4",
-    "decoder_layers.2.self_attn.W_v.weight": "decoder:MHA.Wv.4",
-    "decoder_layers.2.self_attn.W_v.bias": "decoder:MHA.bv.4",
-    "decoder_layers.2.self_attn.W_o.weight": "decoder:MHA.Wo.4",
-    "decoder_layers.2.self_attn.W_o.bias": "decoder:MHA.bo.4",
-    "decoder_layers.2.cross_attn.W_q.weight": "decoder:MHA.Wq.5",
-    "decoder_layers.2.cross_attn.W_q.bias": "decoder:MHA.bq.5",
-    "decoder_layers.2.cross_attn.W_k.weight": "decoder:MHA.Wk.5",
-    "decoder_layers.2.cross_attn.W_k.bias": "decoder:MHA.bk.5",
-    "decoder_layers.2.cross_attn.W_v.weight": "decoder:MHA.Wv.5",
-    "decoder_layers.2.cross_attn.W_v.bias": "decoder:MHA.bv.5",
-    "decoder_layers.2.cross_attn.W_o.weight": "decoder:MHA.Wo.5",
-    "decoder_layers.2.cross_attn.W_o.bias": "decoder:MHA.bo.5",
-    "decoder_layers.2.feed_forward.w_1.weight": "decoder:Linear.W.4",
-    "decoder_layers.2.feed_forward.w_1.bias": "decoder:Linear.b.4",
-    "decoder_layers.2.feed_forward.w_2.weight": "decoder:Linear.W.5",
-    "decoder_layers.2.feed_forward.w_2.bias": "decoder:Linear.b.5",
-    "decoder_layers.2.norm1.weight": "decoder:Norm.A.6",
-    "decoder_layers.2.norm1.bias": "decoder:Norm.B.6",
-    "decoder_layers.2.norm2.weight": "decoder:Norm.A.7",
-    "decoder_layers.2.norm2.bias": "decoder:Norm.B.7",
-    "decoder_layers.2.norm3.weight": "decoder:Norm.A.8",
-    "decoder_layers.2.norm3.bias": "decoder:Norm.B.8",
-    "decoder_layers.3.self_attn.W_q.weight": "decoder:MHA.Wq.6",
-    "decoder_layers.3.self_attn.W_q.bias": "decoder:MHA.bq.6",
-    "decoder_layers.3.self_attn.W_k.weight": "decoder:MHA.Wk.6",
-    "decoder_layers.3.self_attn.W_k.bias": "decoder:MHA.bk.6",
-    "decoder_layers.3.self_attn.W_v.weight": "decoder:MHA.Wv.6",
-    "decoder_layers.3.self_attn.W_v.bias": "decoder:MHA.bv.6",
-    "decoder_layers.3.self_attn.W_o.weight": "decoder:MHA.Wo.6",
-    "decoder_layers.3.self_attn.W_o.bias": "decoder:MHA.bo.6",
-    "decoder_layers.3.cross_attn.W_q.weight": "decoder:MHA.Wq.7",
-    "decoder_layers.3.cross_attn.W_q.bias": "decoder:MHA.bq.7",
-    "decoder_layers.3.cross_attn.W_k.weight": "decoder:MHA.Wk.7",
-    "decoder_layers.3.cross_attn.W_k.bias": "decoder:MHA.bk.7",
-    "decoder_layers.3.cross_attn.W_v.weight": "decoder:MHA.Wv.7",
-    "decoder_layers.3.cross_attn.W_v.bias": "decoder:MHA.bv.7",
-    "decoder_layers.3.cross_attn.W_o.weight": "decoder:MHA.Wo.7",
-    "decoder_layers.3.cross_attn.W_o.bias": "decoder:MHA.bo.7",
-    "decoder_layers.3.feed_forward.w_1.weight": "decoder:Linear.W.6",
-    "decoder_layers.3.feed_forward.w_1.bias": "decoder:Linear.b.6",
-    "decoder_layers.3.feed_forward.w_2.weight": "decoder:Linear.W.7",
-    "decoder_layers.3.feed_forward.w_2.bias": "decoder:Linear.b.7",
-    "decoder_layers.3.norm1.weight": "decoder:Norm.A.9",
-    "decoder_layers.3.norm1.bias": "decoder:Norm.B.9",
-    "decoder_layers.3.norm2.weight": "decoder:Norm.A.10",
-    "decoder_layers.3.norm2.bias": "decoder:Norm.B.10",
-    "decoder_layers.3.norm3.weight": "decoder:Norm.A.11",
-    "decoder_layers.3.norm3.bias": "decoder:Norm.B.11",
-    "decoder_layers.4.self_attn.W_q.weight": "decoder:MHA.Wq.8",
-    "decoder_layers.4.self_attn.W_q.bias": "decoder:MHA.bq.8",
-    "decoder_layers.4.self_attn.W_k.weight": "decoder:MHA.Wk.8",
-    "decoder_layers.4.self_attn.W_k.bias": "decoder:MHA.bk.8",
-    "decoder_layers.4.self_attn.W_v.weight": "decoder:MHA.Wv.8",
-    "decoder_layers.4.self_attn.W_v.bias": "decoder:MHA.bv.8",
-    "decoder_layers.4.self_attn.W_o.weight": "decoder:MHA.Wo.8",
-    "decoder_layers.4.self_attn.W_o.bias": "decoder:MHA.bo.8",
-    "decoder_layers.4.cross_attn.W_q.weight": "decoder:MHA.Wq.9",
-    "decoder_layers.4.cross_attn.W_q.bias": "decoder:MHA.bq.9",
-    "decoder_layers.4.cross_attn.W_k.weight": "decoder:MHA.Wk.9",
-    "decoder_layers.4.cross_attn.W_k.bias": "decoder:MHA.bk.9",
-    "decoder_layers.4.cross_attn.W_v.weight": "decoder:MHA.Wv.9",
-    "decoder_layers.4.cross_attn.W_v.bias": "decoder:MHA.bv.9",
-    "decoder_layers.4.cross_attn.W_o.weight": "decoder:MHA.Wo.9",
-    "decoder_layers.4.cross_attn.W_o.bias": "decoder:MHA.bo.9",
-    "decoder_layers.4.feed_forward.w_1.weight": "decoder:Linear.W.8",
-    "decoder_layers.4.feed_forward.w_1.bias": "decoder:Linear.b.8",
-    "decoder_layers.4.feed_forward.w_2.weight": "decoder:Linear.W.9",
-    "decoder_layers.4.feed_forward.w_2.bias": "decoder:Linear.b.9",
-    "decoder_layers.4.norm1.weight": "decoder:Norm.A.12",
-    "decoder_layers.4.norm1.bias": "decoder:Norm.B.12",
-    "decoder_layers.4.norm2.weight": "decoder:Norm.A.13",
-    "decoder_layers.4.norm2.bias": "decoder:Norm.B.13",
-    "decoder_layers.4.norm3.weight": "decoder:Norm.A.14",
-    "decoder_layers.4.norm3.bias": "decoder:Norm.B.14",
-    "decoder_layers.5.self_attn.W_q.weight": "decoder:MHA.Wq.10",
-    "decoder_layers.5.self_attn.W_q.bias": "decoder:MHA.bq.10",
-    "decoder_layers.5.self_attn.W_k.weight": "decoder:MHA.Wk.10",
-    "decoder_layers.5.self_attn.W_k.bias": "decoder:MHA.bk.10",
-    "decoder_layers.5.self_attn.W_v.weight": "decoder:MHA.Wv.10",
-    "decoder_layers.5.self_attn.W_v.bias": "decoder:MHA.bv.10",
-    "decoder_layers.5.self_attn.W_o.weight": "decoder:MHA.Wo.10",
-    "decoder_layers.5.self_attn.W_o.bias": "decoder:MHA.bo.10",
-    "decoder_layers.5.cross_attn.W_q.weight": "decoder:MHA.Wq.11",
-    "decoder_layers.5.cross_attn.W_q.bias": "decoder:MHA.bq.11",
-    "decoder_layers.5.cross_attn.W_k.weight": "decoder:MHA.Wk.11",
-    "decoder_layers.5.cross_attn.W_k.bias": "decoder:MHA.bk.11",
-    "decoder_layers.5.cross_attn.W_v.weight": "decoder:MHA.Wv.11",
-    "decoder_layers.5.cross_attn.W_v.bias": "decoder:MHA.bv.11",
-    "decoder_layers.5.cross_attn.W_o.weight": "decoder:MHA.Wo.11",
-    "decoder_layers.5.cross_attn.W_o.bias": "decoder:MHA.bo.11",
-    "decoder_layers.5.feed_forward.w_1.weight": "decoder:Linear.W.10",
-    "decoder_layers.5.feed_forward.w_1.bias": "decoder:Linear.b.10",
-    "decoder_layers.5.feed_forward.w_2.weight": "decoder:Linear.W.11",
-    "decoder_layers.5.feed_forward.w_2.bias": "decoder:Linear.b.11",
-    "decoder_layers.5.norm1.weight": "decoder:Norm.A.15",
-    "decoder_layers.5.norm1.bias": "decoder:Norm.B.15",
-    "decoder_layers.5.norm2.weight": "decoder:Norm.A.16",
-    "decoder_layers.5.norm2.bias": "decoder:Norm.B.16",
-    "decoder_layers.5.norm3.weight": "decoder:Norm.A.17",
-    "decoder_layers.5.norm3.bias": "decoder:Norm.B.17",
-    "fc.weight": "Linear.W",
-    "fc.bias": "Linear.b",
   }
+  for L in range(num_layers):
+    p = f"encoder_layers.{L}"
+    name_map.update(mha(f"{p}.self_attn", "encoder", L))
+    name_map.update(ffn(f"{p}.feed_forward", "encoder", L))
+    name_map.update(norm(f"{p}.norm1", "encoder", 2 * L))
+    name_map.update(norm(f"{p}.norm2", "encoder", 2 * L + 1))
+  for L in range(num_layers):
+    p = f"decoder_layers.{L}"
+    name_map.update(mha(f"{p}.self_attn", "decoder", 2 * L))
+    name_map.update(mha(f"{p}.cross_attn", "decoder", 2 * L + 1))
+    name_map.update(ffn(f"{p}.feed_forward", "decoder", L))
+    name_map.update(norm(f"{p}.norm1", "decoder", 3 * L))
+    name_map.update(norm(f"{p}.norm2", "decoder", 3 * L + 1))
+    name_map.update(norm(f"{p}.norm3", "decoder", 3 * L + 2))
+  name_map["fc.weight"] = "Linear.W"
+  name_map["fc.bias"] = "Linear.b"
+  return name_map
+
+# map Torch weight names to CPP weight names, built once at import
+_NAME_MAP = _build_name_map()
 
-  torch_names = set(name for name in torch_vars.keys())
-  numpy_names = set(name for name in numpy_vars.keys())
+def numpy_model_to_torch_model(numpy_vars, torch_vars):
+  name_map = _NAME_MAP
 
-  # validate mapping
-  for item in name_map.items():
-    if item[0] in torch_vars:
-      torch_names.remove(item[0])
-    if item[1] in numpy_vars:
-      numpy_names.remove(item[1])
+  # validate mapping with bulk set differences instead of per-entry removes
+  mapped_torch = {k for k, v in name_map.items() if v is not None}
+  mapped_numpy = {n for v in name_map.values() if v is not None
+                  for n in (v if isinstance(v, tuple) else (v,))}
 
+  torch_names = set(torch_vars) - mapped_torch
+  numpy_names = set(numpy_vars) - mapped_numpy
   assert len(torch_names) == 0, f"Left torch vars {torch_names}"
   assert len(numpy_names) == 0, f"Left numpy vars {numpy_names}"
 
-  # assing numpy to torch
-  for item in name_map.items():
-    if None in item: continue
-    torch_var = torch_vars[item[0]]
-    numpy_var = numpy_vars[item[1]]
-    torch_var.copy_(torch.tensor(numpy_var))
+  def _wrap(arr, torch_var):
+    # zero-copy wrap when the array already matches the parameter storage,
+    # otherwise fall back to an allocating dtype conversion
+    if arr.dtype == np.float32 and torch_var.dtype == torch.float32 \
+        and arr.flags["C_CONTIGUOUS"]:
+      return torch.from_numpy(arr)
+    return torch.as_tensor(arr, dtype=torch_var.dtype)
+
+  # assing numpy to torch (fused qkv projections map to a tuple of
+  # per-projection CPP tensors, concatenated along the row dimension)
+  def _copy_one(item):
+    t_name, n_name = item
+    if n_name is None: return
+    torch_var = torch_vars[t_name]
+    # inference mode is thread-local, so the executor threads start outside
+    # it; re-enter it here or copies into inference tensors (a model built
+    # under torch.inference_mode) are rejected
+    with torch.inference_mode():
+      if isinstance(n_name, tuple):
+        torch_var.copy_(torch.cat([_wrap(numpy_vars[n], torch_var) for n in n_name]))
+      else:
+        torch_var.copy_(_wrap(numpy_vars[n_name], torch_var))
+
+  # the copies target disjoint parameters and copy_ releases the GIL, so
+  # run them across cores instead of one memcpy at a time
+  with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+    list(executor.map(_copy_one, name_map.items()))
     
 
+# sequence-generation vocabulary, shared by the module-level tokenizer
+MAX_SEQ_LENGTH = 100
+BOS_TOKEN = 1
+EOS_TOKEN = 2
+PAD_TOKEN = 3
+
+@functools.lru_cache(maxsize=1024)
+def tokenize(text):
+  # vectorized: one encode plus one C-level buffer copy into the
+  # pad-filled array instead of a per-character Python loop; repeated
+  # prompts come straight from the cache
+  data = text.encode("latin-1")[:MAX_SEQ_LENGTH]
+  tokens = np.full(MAX_SEQ_LENGTH, PAD_TOKEN, dtype=np.int64)
+  tokens[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+  # hand generate a tensor directly (zero-copy wrap) so it does not
+  # have to convert a Python list back into a tensor
+  return torch.from_numpy(tokens)
+
+@functools.lru_cache(maxsize=1024)
+def detokenize(tokens):
+  # takes a tuple so repeated sequences are cache hits; builds the bytes
+  # in one pass instead of O(N^2) string concatenation
+  data = bytes(t for t in tokens if t != EOS_TOKEN and t != PAD_TOKEN)
+  return data.decode("latin-1")
+
+@functools.lru_cache(maxsize=1)
+def _get_model(src_vocab_size, tgt_vocab_size, emb_size, num_heads,
+               num_layers, ff_size, max_seq_length, dropout):
+  # one lazily built model per shape: repeated generation runs skip the
+  # multi-MB layer allocations and just reload weights in place through
+  # numpy_model_to_torch_model
+  model = transformer.Transformer(src_vocab_size, tgt_vocab_size, emb_size,
+    num_heads, num_layers, ff_size, max_seq_length, dropout)
+  if COMPILE:
+    # compile the per-token workhorses here, exactly once, so later runs
+    # reuse the wrappers instead of re-wrapping the cached instance;
+    # generate's Python loop itself stays eager since the KV-cache shapes
+    # grow every step
+    model.encoder_layers = torch.nn.ModuleList(
+      compiled(layer) for layer in model.encoder_layers)
+    model.decoder_layers = torch.nn.ModuleList(
+      compiled(layer) for layer in model.decoder_layers)
+  return model
+
 def test_sequence_generation():
     src_vocab_size = 128
     tgt_vocab_size = 128
     num_layers = 6
     emb_size = 512
     num_heads = 8
-    max_seq_length = 100
+    max_seq_length = MAX_SEQ_LENGTH
     ff_size = 2048
     dropout = 0.1
-    bos_token = 1
-    eos_token = 2
-    pad_token = 3
+    bos_token = BOS_TOKEN
+    eos_token = EOS_TOKEN
+    pad_token = PAD_TOKEN
 
     test_data = [
       [
@@ -1474,54 +1183,60 @@ def test_sequence_generation():
       ]
     ]
 
-    def tokenize(text):
-      if len(text) > max_seq_length:
-          text = text[:max_seq_length]
-
-      tokens = [pad_token] * max_seq_length
-      for i in range(len(text)):
-        tokens[i] = ord(text[i])
-
-      return tokens
-
-    def detokenize(tokens):
-      text = ""
-
-      for t in tokens:
-        if t != eos_token and t != pad_token:
-          text = text + chr(t)
-
-      return text
-
-    print("Create Transformer model")
-    with torch.no_grad():
-      model = transformer.Transformer(src_vocab_size, tgt_vocab_size,
-        emb_size, num_heads, num_layers, ff_size, max_seq_length, dropout)
-
-    print("Load Transformer CPP weights")
-    numpy_vars = np.load("transformer-cpp.npz")
-
-    print("Assign Transformer CPP weights to model")
-    numpy_model_to_torch_model(numpy_vars, model.state_dict())
-
-    for i,test in enumerate(test_data):
-      print(f"=== test {i} ===")
-      src = test[0]
-      tgt = test[1]
-      print("src:", src)
-      src = tokenize(src)
-      tgt = tokenize(tgt)
-      print(f"src tokens:[{src}]")
-
-      out = model.generate(src, bos_token, eos_token, pad_token)
-
-      print("tgt tokens:", tgt)
-      print("out tokens:", out)
-      tgt = detokenize(tgt)
-      out = detokenize(out)
-      print(f"tgt:[{tgt}]")
-      print(f"out:[{out}]")
-      assert out == tgt, f"output is [{out}] but should be [{tgt}]"
+    # inference_mode is cheaper than no_grad (no version-counter or view
+    # tracking) and covers the generate calls themselves, not just the
+    # construction; eval() turns the dropout layers into no-ops
+    with torch.inference_mode():
+      print("Create Transformer model")
+      model = _get_model(src_vocab_size, tgt_vocab_size, emb_size,
+        num_heads, num_layers, ff_size, max_seq_length, dropout)
+      model.eval()
+
+      print("Load Transformer CPP weights")
+      # NpzFile reads members lazily, so only the weights the conversion
+      # actually maps are ever materialized, one at a time
+      numpy_vars = np.load("transformer-cpp.npz")
+
+      print("Assign Transformer CPP weights to model")
+      params = model.state_dict()
+      if COMPILE:
+        # torch.compile wraps each layer in an OptimizedModule that
+        # prefixes its keys with _orig_mod; strip it so the name_map
+        # still lines up with the plain module names
+        params = {k.replace("._orig_mod.", "."): v for k, v in params.items()}
+      numpy_model_to_torch_model(numpy_vars, params)
+      numpy_vars.close()
+
+      if DTYPE is not torch.float32:
+        # optional reduced-precision generation (see the DTYPE gate above);
+        # the cast happens after the fp32 weights are loaded so the stored
+        # values keep full parity with the C++ side
+        model = model.to(DTYPE)
+
+      # encode all test sources in one batched pass; generate then reuses
+      # each example's slice instead of re-running the encoder
+      srcs = torch.stack([tokenize(test[0]) for test in test_data])
+      src_mask = (srcs != pad_token).unsqueeze(1).unsqueeze(2)
+      memories = model.encode(srcs, src_mask)
+
+      for i,test in enumerate(test_data):
+        print(f"=== test {i} ===")
+        tgt = test[1]
+        debug("src:", test[0])
+        src = srcs[i]
+        tgt = tokenize(tgt)
+        debug(f"src tokens:[{src}]")
+
+        out = model.generate(src, bos_token, eos_token, pad_token,
+          enc_output=memories[i:i+1])
+
+        debug("tgt tokens:", tgt)
+        debug("out tokens:", out)
+        tgt = detokenize(tuple(tgt.tolist()))
+        out = detokenize(tuple(int(t) for t in out))
+        print(f"tgt:[{tgt}]")
+        print(f"out:[{out}]")
+        assert out == tgt, f"output is [{out}] but should be [{tgt}]"
 
 
 if __name__ == "__main__":
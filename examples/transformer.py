@@ -7,25 +7,48 @@
 #source: https://towardsdatascience.com/build-your-own-transformer-from-scratch-using-pytorch-84c850470dcb
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 import torch.utils.data as data
+import functools
 import math
 import copy
 import numpy as np
 import collections
 
-def scaled_dot_product_attention(query, key, value, attn_mask=None, dropout=0.0, scale=None) -> torch.Tensor:
+@functools.lru_cache(maxsize=16)
+def causal_mask(size):
+    # lower-triangular "no peeking ahead" mask; cached so repeated forward
+    # passes (autoregressive decoding in particular) reuse one tensor
+    # instead of re-allocating and re-filling an O(size^2) buffer per call
+    return torch.ones(size, size, dtype=torch.bool).tril(diagonal=0)
+
+@functools.lru_cache(maxsize=16)
+def causal_bias(L, S, dtype):
+    # additive counterpart of causal_mask: the upper triangle holds -inf, so
+    # applying causality is one cached add instead of an ones/tril/
+    # logical_not/masked_fill chain re-materialized every forward pass
+    return torch.triu(torch.full((L, S), float("-inf"), dtype=dtype), diagonal=1)
+
+def scaled_dot_product_attention(query, key, value, attn_mask=None, dropout=0.0, is_causal=False, scale=None) -> torch.Tensor:
     # Efficient implementation equivalent to the following:
     L, S = query.size(-2), key.size(-2)
     scale_factor = 1 / math.sqrt(query.size(-1)) if scale is None else scale
 
     attn_weight = query @ key.transpose(-2, -1) * scale_factor
-    if attn_mask is not None:
-        print("\nattn_weight:\n", attn_weight.shape)
-        print("\nattn_mask:\n", attn_mask.shape)
-        attn_weight.masked_fill(attn_mask.logical_not(), float("-inf"))
+    if is_causal:
+        assert attn_mask is None
+        attn_weight = attn_weight + causal_bias(L, S, attn_weight.dtype)
+    elif attn_mask is not None:
+        if attn_mask.dtype == torch.bool:
+            # == 0 folds the inversion into the comparison kernel
+            attn_weight.masked_fill_(attn_mask == 0, float("-inf"))
+        else:
+            # additive float bias, same convention as F.scaled_dot_product_attention
+            attn_weight.add_(attn_mask)
     attn_weight = torch.softmax(attn_weight, dim=-1)
-    attn_weight = torch.dropout(attn_weight, dropout, train=True)
+    if dropout > 0.0:
+        attn_weight = torch.dropout(attn_weight, dropout, train=True)
     output = attn_weight @ value
     return output
 
@@ -54,7 +77,7 @@ class SeqeunceMask:
 
         trg_len = trg.shape[1]
 
-        trg_sub_mask = torch.tril(torch.ones((trg_len, trg_len))).bool()
+        trg_sub_mask = causal_mask(trg_len)
 
         #trg_sub_mask = [trg len, trg len]
 
@@ -73,24 +96,23 @@ class MultiHeadAttention(nn.Module):
         self.num_heads = num_heads
         self.d_k = d_model // num_heads
         
-        self.W_q = nn.Linear(d_model, d_model)
-        self.W_k = nn.Linear(d_model, d_model)
-        self.W_v = nn.Linear(d_model, d_model)
+        # the three input projections live in one fused weight (rows ordered
+        # [W_q; W_k; W_v]) so self-attention reads its input once for a
+        # single (3d x d) GEMM instead of three separate d x d GEMMs --
+        # the same in_proj layout torch.nn.MultiheadAttention uses
+        self.W_qkv = nn.Linear(d_model, 3 * d_model)
         self.W_o = nn.Linear(d_model, d_model)
         self.dropout = nn.Dropout(p=dropout)
         self.name = name
         
     def scaled_dot_product_attention(self, Q, K, V, mask=None):
-        attn_scores = torch.matmul(Q, K.transpose(-2, -1)) / math.sqrt(self.d_k)
-        if mask is not None:
-            #print("attn_scores:\n", attn_scores.shape)
-            #print("mask:\n", mask.shape)
-            #print(self.name, "dot prod mask", mask)
-            attn_scores = attn_scores.masked_fill(mask == 0, float("-inf"))
-            #print(self.name, "dot prod mask attn_scores", attn_scores)
-        attn_probs = torch.softmax(attn_scores, dim=-1)
-        output = torch.matmul(self.dropout(attn_probs), V)
-        return output
+        # the matmul -> scale -> mask -> softmax -> dropout -> matmul chain
+        # is exactly the subgraph torch fuses into a single flash /
+        # memory-efficient kernel, so call the fused op directly
+        # (bool attn_mask convention: True = attend)
+        return F.scaled_dot_product_attention(Q, K, V,
+          attn_mask=None if mask is None else (mask != 0),
+          dropout_p=self.dropout.p if self.training else 0.0)
         
     def split_heads(self, x):
         batch_size, seq_length, d_model = x.size()
@@ -100,14 +122,34 @@ class MultiHeadAttention(nn.Module):
         batch_size, _, seq_length, d_k = x.size()
         return x.transpose(1, 2).contiguous().view(batch_size, seq_length, self.d_model)
         
-    def forward(self, Q, K, V, mask=None):
-        WQ = self.W_q(Q)
-        WK = self.W_k(K)
-        WV = self.W_v(V)
-        Q = self.split_heads(WQ)
-        K = self.split_heads(WK)
-        V = self.split_heads(WV)
-        
+    def forward(self, Q, K, V, mask=None, kv_cache=None):
+        # kv_cache holds split-head K/V from earlier decode steps: a cache
+        # marked "static" keeps the one-off projections of a fixed source
+        # (cross-attention), otherwise new K/V entries are appended per step
+        d = self.d_model
+        w, b = self.W_qkv.weight, self.W_qkv.bias
+        if kv_cache is not None and kv_cache.get("static") and "k" in kv_cache:
+            Q = self.split_heads(F.linear(Q, w[:d], b[:d]))
+            K = kv_cache["k"]
+            V = kv_cache["v"]
+        else:
+            if Q is K and K is V:
+                # self-attention: one fused GEMM over the shared input
+                WQ, WK, WV = self.W_qkv(Q).chunk(3, dim=-1)
+            else:
+                WQ = F.linear(Q, w[:d], b[:d])
+                WK = F.linear(K, w[d:2 * d], b[d:2 * d])
+                WV = F.linear(V, w[2 * d:], b[2 * d:])
+            Q = self.split_heads(WQ)
+            K = self.split_heads(WK)
+            V = self.split_heads(WV)
+            if kv_cache is not None:
+                if "k" in kv_cache:
+                    K = torch.cat([kv_cache["k"], K], dim=2)
+                    V = torch.cat([kv_cache["v"], V], dim=2)
+                kv_cache["k"] = K
+                kv_cache["v"] = V
+
         attn_output_1 = self.scaled_dot_product_attention(Q, K, V, mask)
         #attn_output_2 = scaled_dot_product_attention(Q, K, V, mask)
         cobined_heads = self.combine_heads(attn_output_1)
@@ -153,7 +195,9 @@ class PositionalEncoding(nn.Module):
         pe[:, 0::2] = torch.sin(position * div_term)
         pe[:, 1::2] = torch.cos(position * div_term)
         
-        self.register_buffer('pe', pe.unsqueeze(0))
+        # non-persistent: pe is recomputed above on construction, so there is
+        # no point serializing it or walking it in state_dict-based tooling
+        self.register_buffer('pe', pe.unsqueeze(0), persistent=False)
         
     def forward(self, x):
         return x + self.pe[:, :x.size(1)]
@@ -188,10 +232,10 @@ class DecoderLayer(nn.Module):
         self.norm3 = nn.LayerNorm(d_model)
         self.dropout = nn.Dropout(dropout)
         
-    def forward(self, x, enc_output, src_mask, tgt_mask):
-        attn_output = self.self_attn(x, x, x, tgt_mask)
+    def forward(self, x, enc_output, src_mask, tgt_mask, self_cache=None, cross_cache=None):
+        attn_output = self.self_attn(x, x, x, tgt_mask, kv_cache=self_cache)
         x = self.norm1(x + self.dropout(attn_output))
-        attn_output = self.cross_attn(x, enc_output, enc_output, src_mask)
+        attn_output = self.cross_attn(x, enc_output, enc_output, src_mask, kv_cache=cross_cache)
         x = self.norm2(x + self.dropout(attn_output))
         ff_output = self.feed_forward(x)
         x = self.norm3(x + self.dropout(ff_output))
@@ -215,20 +259,22 @@ class Transformer(nn.Module):
         src_mask = (src != pad_token).unsqueeze(1).unsqueeze(2)
         tgt_mask = (tgt != pad_token).unsqueeze(1).unsqueeze(2)
         seq_length = tgt.size(1)
-        nopeak_mask = (1 - torch.triu(torch.ones(1, seq_length, seq_length), diagonal=1)).bool()
-        tgt_mask = tgt_mask & nopeak_mask
+        tgt_mask = tgt_mask & causal_mask(seq_length)
         return src_mask, tgt_mask
 
+    def encode(self, src, src_mask):
+        enc_output = self.dropout(self.positional_encoding(self.encoder_embedding(src)))
+        for enc_layer in self.encoder_layers:
+            enc_output = enc_layer(enc_output, src_mask)
+        return enc_output
+
     def forward(self, src, tgt, pad_token, enc_output = None):
         src_mask, tgt_mask = self.generate_mask(src, tgt, pad_token)
-        src_embedded = self.dropout(self.positional_encoding(self.encoder_embedding(src)))
-        tgt_embedded = self.dropout(self.positional_encoding(self.decoder_embedding(tgt)))
 
         if enc_output is None:
-          enc_output = src_embedded
-          for enc_layer in self.encoder_layers:
-              enc_output = enc_layer(enc_output, src_mask)
+          enc_output = self.encode(src, src_mask)
 
+        tgt_embedded = self.dropout(self.positional_encoding(self.decoder_embedding(tgt)))
         dec_output = tgt_embedded
         for dec_layer in self.decoder_layers:
             dec_output = dec_layer(dec_output, enc_output, src_mask, tgt_mask)
@@ -237,27 +283,54 @@ class Transformer(nn.Module):
         return output, enc_output
 
     def decode(self, output, row):
-      row = output.detach().numpy()[row]
+      # float() is a no-op at fp32 and lets reduced-precision outputs
+      # (e.g. bfloat16, which numpy cannot represent) convert cleanly
+      row = output.detach().float().numpy()[row]
       token = np.argmax(row)
       return token
 
-    def generate(self, src, bos_token, eos_token, pad_token):
+    def generate(self, src, bos_token, eos_token, pad_token, enc_output=None):
       # set evaluation mode
       self.eval()
 
-      # create source target sequences
-      src = torch.tensor([src], requires_grad=False)
-      tgt = torch.tensor([[pad_token] * src.size(1)], requires_grad=False)
-      token = bos_token # initial target token
+      # run the encoder once over the full source (as_tensor keeps an
+      # existing tensor or array as-is instead of copying a Python list);
+      # a caller that already encoded the source, e.g. as part of a batch,
+      # can pass its 1-row slice in enc_output
+      src = torch.as_tensor(src, dtype=torch.long).unsqueeze(0)
+      src_mask = (src != pad_token).unsqueeze(1).unsqueeze(2)
+      if enc_output is None:
+        enc_output = self.encode(src, src_mask)
+
+      # per-layer KV caches: self-attention grows by one entry per step,
+      # cross-attention projects the encoder output on the first step only
+      self_caches = [{} for _ in self.decoder_layers]
+      cross_caches = [{"static": True} for _ in self.decoder_layers]
 
+      token = bos_token # initial target token
       output = []
-      encoder_cache = None
 
-      # generate next tokens
+      # decoded token history, for the key-padding mask below: the model can
+      # emit pad_token mid-sequence, and the trained weights expect such
+      # positions masked out of self-attention just as generate_mask does
+      # for the full-sequence forward
+      history = torch.full((1, src.size(1)), pad_token)
+
+      # generate next tokens, decoding only the newest position per step --
+      # attention over the earlier positions is replayed from the caches
+      # (a single new query attending to the history is causal by
+      # construction, so only the key-padding part of tgt_mask remains)
       for i in range(src.size(1)):
-        tgt[0,i] = token
-        y, encoder_cache = self.forward(src, tgt, pad_token, encoder_cache)
-        token = self.decode(y[0], i)
+        history[0, i] = token
+        tgt_mask = (history[:, :i+1] != pad_token).unsqueeze(1).unsqueeze(2)
+        tgt = torch.tensor([[token]], requires_grad=False)
+        x = self.decoder_embedding(tgt) + self.positional_encoding.pe[:, i:i+1]
+        x = self.dropout(x)
+        for dec_layer, self_cache, cross_cache in zip(
+            self.decoder_layers, self_caches, cross_caches):
+          x = dec_layer(x, enc_output, src_mask, tgt_mask, self_cache, cross_cache)
+        y = self.fc(x)
+        token = self.decode(y[0], 0)
         output.append(token)
         if token == eos_token:
           break
@@ -273,10 +346,13 @@ def save_model_as_numpy(torch_state_dict, numpy_path):
   np.savez(numpy_path, **model_dict)
 
 def save_model_as_torch(numpy_state_dict, torch_path):
+  # from_numpy wraps each array in place (ascontiguousarray is a no-op for
+  # C-ordered input), so building the dict moves no weight bytes; torch.save
+  # already writes the storages as raw blocks in its zip container
   model_dict = collections.OrderedDict()
   for m in numpy_state_dict:
     arr = numpy_state_dict[m]
-    model_dict[m] = torch.FloatTensor(arr)
+    model_dict[m] = torch.from_numpy(np.ascontiguousarray(arr))
   torch.save(model_dict, torch_path)
 
 def print_model(model_state_dict):
@@ -304,7 +380,11 @@ def main():
 
   # Load model
   try:
-    transformer.load_state_dict(torch.load(model_path))
+    state_dict = torch.load(model_path)
+    # checkpoints written while pe was persistent still carry the table;
+    # drop the stale entry, the buffer is recomputed on construction
+    state_dict.pop("positional_encoding.pe", None)
+    transformer.load_state_dict(state_dict)
     print("Model loaded from", model_path)
   except:
     print("New model created")